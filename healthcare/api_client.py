@@ -0,0 +1,178 @@
+# api_client.py
+# Backend client for the Streamlit frontend: one pooled keep-alive session per
+# Streamlit server, TTL-cached reads, and chat history that is loaded
+# incrementally (only messages newer than what the page already holds).
+import os
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")  # change if backend is remote
+
+TIMEOUT = (5, 60)             # (connect, read) seconds
+STT_TIMEOUT = (5, 300)        # transcription of long clips takes a while
+PROFILE_TTL = 300             # seconds a patient profile is reused across reruns
+HISTORY_TTL = 15              # seconds a history page is reused across reruns
+HISTORY_PAGE_SIZE = 50
+
+
+class ApiError(Exception):
+    """Raised when the backend is unreachable or answers with an error."""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    Shared by every user session of this Streamlit server, so connections
+    to the API are reused instead of opened per button press.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _request(method: str, path: str, timeout=TIMEOUT, **kwargs) -> dict:
+    try:
+        response = get_session().request(method, f"{API_URL}{path}", timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        raise ApiError(f"Backend unreachable: {e}")
+    if response.status_code != 200:
+        raise ApiError(response.text, response.status_code)
+    return response.json()
+
+
+# -------------------------------
+# Cached reads
+# -------------------------------
+@st.cache_data(ttl=PROFILE_TTL, show_spinner=False)
+def fetch_patient(patient_id: str):
+    """
+    Patient profile, or None if there is no such patient.
+    """
+    try:
+        return _request("GET", f"/patients/{patient_id}")
+    except ApiError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+def _history_page(conversation_id: str, before: str = None, after: str = None,
+                  limit: int = HISTORY_PAGE_SIZE) -> dict:
+    params = {"limit": limit}
+    if before:
+        params["before"] = before
+    if after:
+        params["after"] = after
+    return _request("GET", f"/chat/{conversation_id}", params=params)
+
+
+@st.cache_data(ttl=HISTORY_TTL, show_spinner=False)
+def fetch_history_page(conversation_id: str, before: str = None, after: str = None,
+                       limit: int = HISTORY_PAGE_SIZE) -> dict:
+    """
+    One ChatHistoryPage relative to a cursor: older with `before`, newer with `after`.
+    """
+    return _history_page(conversation_id, before, after, limit)
+
+
+# -------------------------------
+# Incremental chat history (kept in st.session_state per conversation)
+# -------------------------------
+def _conversation_key(conversation_id: str) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def _conversation(conversation_id: str) -> tuple:
+    """
+    (state, loaded now) for a conversation, loading its latest page if the
+    session holds none of it yet.
+    """
+    key = _conversation_key(conversation_id)
+    state = st.session_state.get(key)
+    if state is not None and state["after_cursor"]:
+        return state, False
+    # Not cached: the latest page moves with every turn
+    page = _history_page(conversation_id)
+    state = st.session_state[key] = {
+        "messages": page["history"],
+        "before_cursor": page["before_cursor"],
+        "after_cursor": page["after_cursor"],
+        "has_older": page["has_more"],
+    }
+    return state, True
+
+
+def load_conversation(conversation_id: str) -> dict:
+    """
+    {"messages", "before_cursor", "after_cursor", "has_older"} for a conversation.
+    The first call loads the latest page; later calls only fetch newer messages.
+    """
+    state, loaded = _conversation(conversation_id)
+    if not loaded:
+        # Turns sent from elsewhere (another tab, the clinic's device)
+        while True:
+            page = fetch_history_page(conversation_id, after=state["after_cursor"])
+            _append(state, page["history"], page["after_cursor"])
+            if not page["has_more"]:
+                break
+    return state
+
+
+def load_older(conversation_id: str) -> dict:
+    """
+    Prepend the page of messages before the oldest one held.
+    """
+    state, _ = _conversation(conversation_id)
+    if state["has_older"]:
+        page = fetch_history_page(conversation_id, before=state["before_cursor"])
+        state["messages"] = page["history"] + state["messages"]
+        state["before_cursor"] = page["before_cursor"]
+        state["has_older"] = page["has_more"]
+    return state
+
+
+def _append(state: dict, messages: list, after_cursor: str):
+    held = {m["id"] for m in state["messages"][-len(messages):]} if messages else set()
+    state["messages"] += [m for m in messages if m["id"] not in held]
+    state["after_cursor"] = after_cursor or state["after_cursor"]
+
+
+# -------------------------------
+# Actions (never cached)
+# -------------------------------
+def send_chat(conversation_id: str, message: str, source_lang: str = "auto", target_lang: str = "en") -> dict:
+    """
+    Send a patient message. The response carries only the messages after the
+    held cursor (the new turn, plus any sent from elsewhere), which are appended.
+    """
+    state, _ = _conversation(conversation_id)
+    result = _request("POST", "/chat/", json={
+        "conversation_id": conversation_id,
+        "message": message,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "history_after": state["after_cursor"],
+    })
+    if state["after_cursor"]:
+        _append(state, result["history"], result["after_cursor"])
+    else:
+        # No cursor yet (empty conversation): the response is the whole history
+        state["messages"] = result["history"]
+        state["after_cursor"] = result["after_cursor"]
+    return state
+
+
+def check_symptoms(payload: dict) -> dict:
+    return _request("POST", "/symptom-check/", json=payload)
+
+
+def transcribe(file, target_lang: str) -> dict:
+    return _request("POST", "/stt-translate/", params={"target_lang": target_lang},
+                    files={"file": (file.name, file, file.type)}, timeout=STT_TIMEOUT)
@@ -1,40 +1,213 @@
 # app.py
-from fastapi import FastAPI, UploadFile, Depends
-from services.stt_translate import speech_to_text_and_translate, init_whisper
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+import json
+import orjson
+from datetime import datetime
+from typing import Annotated, Optional
+from fastapi import FastAPI, UploadFile, Depends, HTTPException, Request, WebSocket, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from pymongo.errors import DuplicateKeyError
+from services.stt_translate import (
+    speech_to_text_and_translate,
+    init_whisper,
+    shutdown_whisper,
+    whisper_models,
+    TranscriptionQueueFull,
+    UploadTooLarge,
+    whisper_started,
+)
+from services.audio import UndecodableAudio
+from services.stt_stream import stream_transcribe, websocket_audio_chunks
 from services.symptom_checker import analyze_symptoms
-from services.chat import doctor_patient_chat
-from services.patient_profiles import create_patient_profile, get_patient_profile
+from services.chat import doctor_patient_chat, stream_doctor_patient_chat
+from services.patient_profiles import (
+    create_patient_profile,
+    get_patient_profile,
+    get_patient_profiles,
+    bulk_import_patients,
+    MAX_BATCH_IDS,
+)
+from services.llm_client import close_llm_client
+from services.chat_history import (
+    migrate_legacy_histories,
+    load_history_page,
+    stream_history,
+    decode_cursor,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
 from schemas import (
     STTResponse,
     SymptomCheckRequest,
     SymptomCheckResponse,
     ChatRequest,
     ChatResponse,
+    ChatHistoryPage,
     PatientProfileCreate,
     PatientProfileResponse,
+    PatientBatchRequest,
+    PatientBatchResponse,
+    BulkImportResponse,
+    SymptomCheckJobRequest,
+    JobStatusResponse,
+    LANG_CODE_PATTERN,
+)
+from services.jobs import submit_job, get_job, start_job_worker, stop_job_worker, InvalidCallbackURL
+from config import (
+    JOB_WORKERS_ENABLED,
+    JOB_MAX_AUDIO_BYTES,
+    JOB_CONCURRENCY,
+    SERVICE_ROLES,
+    STT_ENABLED,
+    WHISPER_PRELOAD,
 )
-from database import get_db
-from config import WHISPER_MODEL_NAME
+from database import get_db, init_db, start_sync, stop_sync
+from metrics import span, timing_middleware, render_metrics
+
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
 
 app = FastAPI(title="Rural Healthcare API (MongoDB)")
+app.middleware("http")(timing_middleware)
+
+# Filled in by startup_event; reported by /health/ready
+startup_report = {"import_ms": IMPORT_MS, "roles": sorted(SERVICE_ROLES)}
+ready = False
 
 # -------------------------------
-# Startup: load Whisper once
+# Startup: indexes, migrations, and the optional roles (Whisper, job worker)
 # -------------------------------
 @app.on_event("startup")
 async def startup_event():
-    await init_whisper()
-    print(f"✅ Whisper model '{WHISPER_MODEL_NAME}' initialized successfully.")
+    global ready
+    started = time.perf_counter()
+    step = started
+
+    def timed(name: str):
+        nonlocal step
+        now = time.perf_counter()
+        startup_report[f"{name}_ms"] = round((now - step) * 1000, 1)
+        step = now
+
+    db = await get_db()
+    await init_db(db)
+    timed("init_db")
+    await migrate_legacy_histories(db)
+    timed("migrations")
+    start_sync()
+    if STT_ENABLED and WHISPER_PRELOAD:
+        await init_whisper()
+        timed("whisper")
+    if JOB_WORKERS_ENABLED and "jobs" in SERVICE_ROLES:
+        # STT jobs are left for replicas that run the "stt" role
+        concurrency = JOB_CONCURRENCY if STT_ENABLED else {**JOB_CONCURRENCY, "stt": 0}
+        start_job_worker(db, concurrency)
+        timed("jobs")
+    startup_report["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    ready = True
+    print(f"✅ Started in {startup_report['startup_ms']} ms (imports {IMPORT_MS} ms); "
+          f"roles: {', '.join(sorted(SERVICE_ROLES)) or 'api only'}.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global ready
+    ready = False
+    await stop_job_worker()
+    await stop_sync()
+    await close_llm_client()
+    await shutdown_whisper()
 
 
 # -------------------------------
 # Speech-to-text + Translation
 # -------------------------------
+# Checked at the edge: the code becomes part of a stored field name
+TargetLang = Annotated[str, Query(pattern=LANG_CODE_PATTERN)]
+
+
+def require_stt():
+    # Speech endpoints are served only by replicas running the "stt" role
+    if not STT_ENABLED:
+        raise HTTPException(status_code=503, detail="Speech-to-text is not enabled on this server.",
+                            headers={"Retry-After": "30"})
+
+
+def whisper_override(model: Optional[str]) -> Optional[str]:
+    # ?model=<tier> pins a loaded Whisper tier; missing or "auto" picks per clip
+    if not model or model == "auto":
+        return None
+    if model not in whisper_models():
+        raise HTTPException(status_code=400,
+                            detail=f"model must be 'auto' or one of: {', '.join(whisper_models())}")
+    return model
+
+
 @app.post("/stt-translate/", response_model=STTResponse)
-async def stt_translate(file: UploadFile, target_lang: str = "en", db=Depends(get_db)):
-    result = await speech_to_text_and_translate(file, target_lang)
-    await db["transcripts"].insert_one(result)
-    return result
+async def stt_translate(file: UploadFile, target_lang: TargetLang = "en", model: Optional[str] = None,
+                        db=Depends(get_db)):
+    require_stt()
+    model = whisper_override(model)
+    try:
+        # Stores the transcript (or reuses the stored one for a repeat upload)
+        return await speech_to_text_and_translate(file, db, target_lang, model)
+    except TranscriptionQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UndecodableAudio as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def transcript_doc(event: dict) -> dict:
+    # Final streaming event -> stored transcript (same fields as the one-shot endpoint)
+    doc = {k: v for k, v in event.items() if k != "type"}
+    doc["created_at"] = datetime.utcnow()
+    return doc
+
+
+@app.post("/stt-translate/stream")
+async def stt_translate_stream(request: Request, target_lang: TargetLang = "en", model: Optional[str] = None,
+                               db=Depends(get_db)):
+    """
+    Chunked upload: the raw audio body is decoded and transcribed as it arrives,
+    and partial transcripts/translations are streamed back as NDJSON.
+    """
+    require_stt()
+    model = whisper_override(model)
+
+    async def events():
+        async for event in stream_transcribe(request.stream(), target_lang, model):
+            if event["type"] == "final":
+                await db["transcripts"].insert_one(transcript_doc(event))
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.websocket("/ws/stt-translate/")
+async def stt_translate_ws(websocket: WebSocket, target_lang: TargetLang = "en", model: Optional[str] = None):
+    """
+    Send binary audio frames, then the text frame "end".
+    Receives partial events per window and a final event as JSON.
+    """
+    if not STT_ENABLED:
+        # 1013: try again later (on a replica with the "stt" role)
+        await websocket.close(code=1013)
+        return
+    if model and model != "auto" and model not in whisper_models():
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    db = await get_db()
+    model = None if model == "auto" else model
+    async for event in stream_transcribe(websocket_audio_chunks(websocket), target_lang, model):
+        if event["type"] == "final":
+            await db["transcripts"].insert_one(transcript_doc(event))
+        await websocket.send_json(event)
+    await websocket.close()
 
 
 # -------------------------------
@@ -43,28 +216,124 @@ async def stt_translate(file: UploadFile, target_lang: str = "en", db=Depends(ge
 @app.post("/symptom-check/", response_model=SymptomCheckResponse)
 async def symptom_check(request: SymptomCheckRequest, db=Depends(get_db)):
     result = await analyze_symptoms(request, db)
-    await db["symptom_checks"].insert_one(result.dict())
+    with span("db_write"):
+        await db["symptom_checks"].insert_one({**result.dict(), "created_at": datetime.utcnow()})
     return result
 
 
+# -------------------------------
+# Background jobs: submit now, poll GET /jobs/{id} or get a webhook
+# -------------------------------
+@app.post("/jobs/stt-translate/", response_model=JobStatusResponse, status_code=202)
+async def submit_stt_job(file: UploadFile, target_lang: TargetLang = "en", model: Optional[str] = None,
+                         priority: int = 0, callback_url: Optional[str] = None, db=Depends(get_db)):
+    model = whisper_override(model)
+    data = bytearray()
+    while chunk := await file.read(64 * 1024):
+        data += chunk
+        if len(data) > JOB_MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Audio upload exceeds {JOB_MAX_AUDIO_BYTES} bytes")
+    payload = {"audio": bytes(data), "target_lang": target_lang, "model": model}
+    try:
+        return await submit_job(db, "stt", payload, priority, callback_url)
+    except InvalidCallbackURL as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/jobs/symptom-check/", response_model=JobStatusResponse, status_code=202)
+async def submit_symptom_check_job(request: SymptomCheckJobRequest, db=Depends(get_db)):
+    payload = request.dict(exclude={"priority", "callback_url"})
+    try:
+        return await submit_job(db, "symptom_check", payload, request.priority, request.callback_url)
+    except InvalidCallbackURL as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def fetch_job(job_id: str, db=Depends(get_db)):
+    job = await get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 # -------------------------------
 # Doctor–Patient Chat (Groq + Translation)
 # -------------------------------
+def history_response(payload: dict) -> Response:
+    # Serialized once by orjson from HistoryMessage objects; response_model only
+    # documents the shape, so long histories skip per-message re-validation
+    return Response(orjson.dumps(payload), media_type="application/json")
+
+
 @app.post("/chat/", response_model=ChatResponse)
 async def chat(request: ChatRequest, db=Depends(get_db)):
-    result = await doctor_patient_chat(request, db)
-    return result
+    if request.history_after:
+        try:
+            decode_cursor(request.history_after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return history_response(await doctor_patient_chat(request, db))
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, db=Depends(get_db)):
+    """
+    Server-sent events: "patient", then "token" events as the doctor reply is
+    generated, "translation" events per translated sentence, and a final "done"
+    once the turn is saved. Non-streaming clients keep using POST /chat/.
+    """
+    async def events():
+        try:
+            async for event, data in stream_doctor_patient_chat(request, db):
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@app.get("/chat/{conversation_id}", response_model=ChatResponse)
-async def get_chat_history(conversation_id: str, db=Depends(get_db)):
+
+@app.get("/chat/{conversation_id}", response_model=ChatHistoryPage)
+async def get_chat_history(
+    conversation_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db=Depends(get_db),
+):
+    """
+    Retrieve chat history a page at a time (latest page by default).
+    Use the returned before_cursor / after_cursor to page older / newer.
+    """
+    try:
+        return history_response(await load_history_page(db, conversation_id, before=before, after=after, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/chat/{conversation_id}/stream")
+async def stream_chat_history(conversation_id: str, after: Optional[str] = None, db=Depends(get_db)):
     """
-    Retrieve full chat history by conversation_id.
+    Stream the whole history (or everything after a cursor) as NDJSON, one message per line.
     """
-    conversation = await db["chats"].find_one({"conversation_id": conversation_id})
-    if not conversation:
-        return ChatResponse(conversation_id=conversation_id, history=[])
-    return ChatResponse(conversation_id=conversation_id, history=conversation["history"])
+    try:
+        messages = stream_history(db, conversation_id, after=after)
+        first = await anext(messages, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        if first is None:
+            return
+        yield orjson.dumps(first) + b"\n"
+        async for message in messages:
+            yield orjson.dumps(message) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 # -------------------------------
@@ -72,12 +341,78 @@ async def get_chat_history(conversation_id: str, db=Depends(get_db)):
 # -------------------------------
 @app.post("/patients/", response_model=PatientProfileResponse)
 async def add_patient(profile: PatientProfileCreate, db=Depends(get_db)):
-    return await create_patient_profile(profile, db)
+    try:
+        return await create_patient_profile(profile, db)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=f"Patient {profile.patient_id!r} already exists")
+
+
+@app.post("/patients/bulk", response_model=BulkImportResponse)
+async def bulk_add_patients(request: Request, format: Optional[str] = None, db=Depends(get_db)):
+    """
+    Stream a CSV (header row; list fields separated by ";") or NDJSON body of
+    patient profiles. Rows are validated and inserted in unordered chunks;
+    failures are reported per line without stopping the import. Quoted CSV
+    fields may span lines; rows over 64 KiB are rejected individually.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    return await bulk_import_patients(request.stream(), fmt, db)
+
+
+@app.post("/patients/batch", response_model=PatientBatchResponse)
+async def fetch_patients(batch: PatientBatchRequest, db=Depends(get_db)):
+    """
+    Fetch many profiles in one request (single $in query).
+    """
+    if len(batch.patient_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} patient_ids per request")
+    return await get_patient_profiles(batch.patient_ids, db)
 
 
 @app.get("/patients/{patient_id}", response_model=PatientProfileResponse)
 async def fetch_patient(patient_id: str, db=Depends(get_db)):
     profile = await get_patient_profile(patient_id, db)
     if not profile:
-        return {"error": "Patient not found"}
+        raise HTTPException(status_code=404, detail="Patient not found")
     return profile
+
+
+# -------------------------------
+# Health checks
+# -------------------------------
+@app.get("/health/live", include_in_schema=False)
+async def health_live():
+    # The process is up and serving requests
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    """
+    Ready once startup finished, the database answers a ping and, when
+    Whisper is preloaded, the transcription pool is up. Includes the
+    startup timings.
+    """
+    checks = {"startup": ready}
+    try:
+        db = await get_db()
+        await asyncio.wait_for(db.command("ping"), timeout=2)
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+    if STT_ENABLED and WHISPER_PRELOAD:
+        checks["whisper"] = whisper_started()
+    ok = all(checks.values())
+    body = {"status": "ready" if ok else "not ready", "checks": checks, "startup": startup_report}
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
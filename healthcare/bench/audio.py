@@ -0,0 +1,40 @@
+# bench/audio.py
+# Synthetic speech-like WAV clips, generated deterministically (no binary fixtures).
+import io
+import wave
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_wav(seconds: float = 5.0, seed: int = 0) -> bytes:
+    """
+    Mono 16-bit WAV: voiced "syllables" (harmonic tones with a pitch glide
+    and amplitude envelope) separated by short pauses with low noise.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    signal = rng.normal(0, 0.003, n)
+
+    position = 0
+    while position < n:
+        length = int(rng.uniform(0.15, 0.35) * SAMPLE_RATE)
+        pause = int(rng.uniform(0.05, 0.2) * SAMPLE_RATE)
+        end = min(position + length, n)
+        span = t[position:end] - t[position]
+        pitch = rng.uniform(110, 220) * (1 + 0.2 * span)
+        phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = np.sin(np.pi * np.linspace(0, 1, end - position))
+        signal[position:end] += 0.2 * voiced * envelope
+        position = end + pause
+
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
@@ -0,0 +1,84 @@
+# bench/fake_llm.py
+# OpenAI-compatible chat completions stand-in for Groq, with configurable latency.
+import asyncio
+import json
+import threading
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Valid for the symptom checker's ANALYSIS_SCHEMA
+SYMPTOM_JSON = json.dumps({
+    "summary": "Fever and cough for three days.",
+    "probable_conditions": ["Viral upper respiratory infection", "Influenza"],
+    "recommendations": ["Rest", "Drink plenty of fluids", "Consult a doctor if symptoms worsen"],
+    "recommended_tests": ["Complete blood count"],
+    "recommended_medicines": ["Paracetamol"],
+})
+CHAT_REPLY = ("I am sorry you are not feeling well. How long have you had these symptoms? "
+              "Do you have a fever, and have you taken any medicine for it? "
+              "Please drink enough water and rest today.")
+
+
+def create_app(latency_ms: float = 300, token_ms: float = 5) -> FastAPI:
+    """
+    latency_ms: time to first token (whole response time when not streaming)
+    token_ms:   delay between streamed tokens
+    """
+    app = FastAPI()
+    stats = {"requests": 0}
+    app.state.stats = stats
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        content = SYMPTOM_JSON if body.get("response_format") else CHAT_REPLY
+        await asyncio.sleep(latency_ms / 1000)
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": "bench", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            })
+
+        async def events():
+            for word in content.split(" "):
+                chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_ms / 1000)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+class FakeLLMServer:
+    """
+    Runs the fake LLM on its own thread and event loop, so its sleeps and
+    I/O do not show up as lag on the loop of the app under test.
+    """
+
+    def __init__(self, port: int = 8765, latency_ms: float = 300, token_ms: float = 5):
+        self.app = create_app(latency_ms, token_ms)
+        self.url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    @property
+    def requests(self) -> int:
+        return self.app.state.stats["requests"]
@@ -0,0 +1,64 @@
+# bench/import_report.py
+# Import-time report: imports the app in a fresh interpreter with
+# `python -X importtime` and lists the slowest top-level imports, so heavy
+# dependencies creeping into the API's import path show up early.
+#
+#   cd healthcare
+#   SERVICE_ROLES=jobs python -m bench.import_report --top 15
+import argparse
+import os
+import subprocess
+import sys
+
+# Must never be imported by an STT-free replica
+HEAVY = ("whisper", "torch")
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    `-X importtime` lines -> [(module, self_us, cumulative_us, depth), ...]
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the slowest imports of a module.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        capture_output=True, text=True, env=os.environ,
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr.splitlines()[-1] + "\n")
+        sys.exit(proc.returncode)
+
+    # Depth 1 = modules imported directly by the top-level import statements
+    top_level = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)
+    total = next((r[2] for r in rows if r[0] == args.module), sum(r[2] for r in top_level))
+    print(f"import {args.module}: {total / 1000:.1f} ms ({len(rows)} modules)\n")
+    print(f"{'module':<40} {'cumulative':>12} {'self':>10}")
+    for name, self_us, cumulative_us, _ in top_level[:args.top]:
+        print(f"{name:<40} {cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms")
+
+    loaded = {r[0].split(".")[0] for r in rows}
+    heavy = [name for name in HEAVY if name in loaded]
+    roles = os.getenv("SERVICE_ROLES", "stt,jobs")
+    if heavy:
+        print(f"\n⚠️ Heavy modules imported: {', '.join(heavy)} (SERVICE_ROLES={roles!r})")
+    else:
+        print(f"\n✅ No heavy modules imported (SERVICE_ROLES={roles!r})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench/loadgen.py
+# Closed-loop load generator and event-loop lag monitor.
+import asyncio
+import time
+import httpx
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """
+    Samples event-loop lag: how late a periodic sleep wakes up. Lag comes
+    from blocking work on the loop (sync I/O, CPU-heavy code, big JSON).
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> dict:
+        return {
+            "lag_p99_ms": round(percentile(self.samples, 99) * 1000, 2),
+            "lag_max_ms": round(max(self.samples, default=0.0) * 1000, 2),
+        }
+
+
+async def run_scenario(client: httpx.AsyncClient, send, concurrency: int, requests: int,
+                       start: int = 0) -> dict:
+    """
+    Keep `concurrency` requests in flight until `requests` have completed.
+    `send(client, i)` issues request number i (from `start`) and returns the httpx.Response.
+    """
+    latencies, errors = [], 0
+    counter = iter(range(start, start + requests))
+    monitor = LoopLagMonitor()
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            began = time.perf_counter()
+            try:
+                response = await send(client, i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - began)
+            errors += not ok
+
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        **monitor.summary(),
+    }
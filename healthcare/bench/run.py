@@ -0,0 +1,269 @@
+# bench/run.py
+# Benchmark harness: runs app.app in-process against local stand-ins for Groq,
+# the translator and MongoDB, drives the main endpoints at a fixed concurrency
+# and reports RPS, latency percentiles and event-loop lag.
+#
+#   cd healthcare
+#   python -m bench.run --concurrency 16 --requests 200 --save bench/baseline.json
+#   python -m bench.run --concurrency 16 --requests 200 --compare bench/baseline.json
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import uuid
+
+SCENARIOS = ("patients", "symptom", "chat", "stt")
+# Metrics where a higher value is a regression (for "rps" lower is worse)
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "lag_p99_ms")
+
+SYMPTOMS = [
+    "fever and dry cough for three days",
+    "headache and vomiting since morning",
+    "stomach pain after eating, loose motions",
+    "rash on both arms, itching at night",
+    "joint pain and swelling in the knees",
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the healthcare API with local stand-ins.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--db", default="mongomock",
+                        help="'mongomock', 'local' (embedded SQLite store) or a mongodb:// URL")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=5)
+    parser.add_argument("--translate-latency-ms", type=float, default=50)
+    parser.add_argument("--whisper", choices=("real", "fake"), default="real",
+                        help="'fake' replaces the Whisper pool with a fixed delay")
+    parser.add_argument("--whisper-latency-ms", type=float, default=500)
+    parser.add_argument("--audio-seconds", type=float, default=5)
+    parser.add_argument("--symptom-cache", action="store_true",
+                        help="let symptom checks hit the response cache")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--save", help="write results to this JSON baseline")
+    parser.add_argument("--compare", help="compare results with this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change counted as a regression (default 10%%)")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, llm_url: str):
+    """
+    Must run before the app (and config) is imported.
+    """
+    os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "bench"
+    os.environ["GROQ_BASE_URL"] = llm_url
+    os.environ["LLM_MAX_RETRIES"] = "0"
+    if args.db == "local":
+        os.environ["STORAGE_BACKEND"] = "local"
+        os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+        # No central Mongo here; keep the outbox sync from polling during the run
+        os.environ["SYNC_INTERVAL_SEC"] = "3600"
+    elif args.db.startswith("mongodb"):
+        os.environ["STORAGE_BACKEND"] = "mongo"
+        os.environ["MONGO_URL"] = args.db
+        os.environ["MONGO_DB_NAME"] = f"rural_healthcare_bench_{uuid.uuid4().hex[:8]}"
+
+
+class FakeTranscriptionPool:
+    """
+    Stand-in for services.stt_translate.TranscriptionPool: a fixed delay.
+    """
+
+    models = ["fake"]
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+
+    async def transcribe(self, audio, model: str = None) -> dict:
+        await asyncio.sleep(self.latency)
+        return {"text": "I have had a fever since yesterday.", "language": "en", "segments": [],
+                "whisper": {"model": "fake", "language_probability": None, "escalated_segments": 0}}
+
+    async def shutdown(self):
+        pass
+
+
+def install_stand_ins(args):
+    """
+    Swap the translator (and optionally Whisper / Mongo) for local stand-ins.
+    """
+    import database
+    from services import translation, stt_translate
+
+    latency = args.translate_latency_ms / 1000
+
+    def fake_translate(text: str, source: str, target: str) -> str:
+        # Runs on the translation thread pool, like the real network call
+        time.sleep(latency)
+        return text
+
+    translation._translate_sync = fake_translate
+
+    if args.whisper == "fake":
+        stt_translate.transcription_pool = FakeTranscriptionPool(args.whisper_latency_ms)
+
+    if args.db == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+        database.db = AsyncMongoMockClient()["rural_healthcare_bench"]
+
+
+def make_senders(run_id: str, args, wav: bytes) -> dict:
+    conversations = max(1, args.concurrency)
+
+    def patient(i: int) -> dict:
+        return {
+            "patient_id": f"{run_id}-{i}",
+            "name": f"Bench Patient {i}",
+            "age": 20 + i % 60,
+            "sex": "female" if i % 2 else "male",
+            "allergies": ["penicillin"] if i % 5 == 0 else [],
+            "chronic_conditions": ["diabetes"] if i % 7 == 0 else [],
+            "medications": [],
+        }
+
+    async def patients(client, i):
+        # Alternate creating new profiles and reading seeded ones
+        if i % 2:
+            return await client.get(f"/patients/{run_id}-{i % conversations}")
+        return await client.post("/patients/", json=patient(conversations + i))
+
+    async def symptom(client, i):
+        return await client.post("/symptom-check/", json={
+            "conversation_id": f"{run_id}-{i % conversations}",
+            "text": f"{SYMPTOMS[i % len(SYMPTOMS)]} (case {i})" if not args.symptom_cache
+                    else SYMPTOMS[i % len(SYMPTOMS)],
+            "use_cache": args.symptom_cache,
+        })
+
+    async def chat(client, i):
+        return await client.post("/chat/", json={
+            "conversation_id": f"{run_id}-{i % conversations}",
+            "message": f"I still have the fever, day {i}. What should I do?",
+            "source_lang": "hi",
+            "target_lang": "en",
+        })
+
+    async def stt(client, i):
+        # Stamp the last sample so every upload hashes differently and
+        # really reaches Whisper (repeat uploads are served from storage)
+        clip = wav[:-4] + struct.pack("<i", i)
+        return await client.post("/stt-translate/?target_lang=en",
+                                 files={"file": ("clip.wav", clip, "audio/wav")})
+
+    async def seed(client):
+        for i in range(conversations):
+            await client.post("/patients/", json=patient(i))
+
+    return {"patients": patients, "symptom": symptom, "chat": chat, "stt": stt, "_seed": seed}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print a comparison table; return the list of regressions.
+    """
+    regressions = []
+    print(f"\n{'scenario':<10} {'metric':<11} {'baseline':>10} {'current':>10} {'change':>8}")
+    for scenario, current in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if not previous:
+            continue
+        for metric in ("rps",) + LOWER_IS_BETTER:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if metric == "rps" else change > tolerance
+            flag = "  REGRESSION" if worse else ""
+            print(f"{scenario:<10} {metric:<11} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{flag}")
+            if worse:
+                regressions.append((scenario, metric, old, new))
+    return regressions
+
+
+def print_results(results: dict):
+    columns = ("rps", "p50_ms", "p95_ms", "p99_ms", "lag_p99_ms", "lag_max_ms", "errors")
+    print(f"\n{'scenario':<10} " + " ".join(f"{c:>10}" for c in columns))
+    for scenario, r in results.items():
+        print(f"{scenario:<10} " + " ".join(f"{r[c]:>10}" for c in columns))
+
+
+async def run(args) -> dict:
+    import httpx
+    import uvicorn
+    import database
+    import app as app_module
+    from bench.audio import synthetic_wav
+    from bench.loadgen import run_scenario
+
+    install_stand_ins(args)
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=args.port,
+                                           log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+
+    run_id = f"bench-{uuid.uuid4().hex[:6]}"
+    senders = make_senders(run_id, args, synthetic_wav(args.audio_seconds))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits,
+                                     timeout=120) as client:
+            await senders["_seed"](client)
+            for scenario in args.scenarios.split(","):
+                scenario = scenario.strip()
+                if scenario not in SCENARIOS:
+                    raise SystemExit(f"Unknown scenario: {scenario}")
+                # Short warm-up so connection setup and first-call costs are excluded
+                await run_scenario(client, senders[scenario], args.concurrency, args.concurrency)
+                results[scenario] = await run_scenario(client, senders[scenario], args.concurrency,
+                                                       args.requests, start=args.concurrency)
+                print(f"✅ {scenario}: {results[scenario]['rps']} req/s")
+    finally:
+        if args.db.startswith("mongodb"):
+            await database.client.drop_database(database.db.name)
+        server.should_exit = True
+        await serving
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from bench.fake_llm import FakeLLMServer
+
+    llm = FakeLLMServer(args.llm_port, args.llm_latency_ms, args.llm_token_ms)
+    configure_environment(args, llm.url)
+    llm.start()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        llm.stop()
+
+    print_results(results)
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("⚠️ Baseline was recorded with different settings; comparison may be misleading.")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
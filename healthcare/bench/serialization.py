@@ -0,0 +1,119 @@
+# bench/serialization.py
+# Chat history response cost as the conversation grows: the previous path
+# (dicts validated into schemas.ChatResponse, then re-validated and
+# serialized by FastAPI's response_model) against HistoryMessage objects
+# serialized once with orjson. Both run through FastAPI in-process, from the
+# same stored message documents.
+#
+#   cd healthcare
+#   python -m bench.serialization --sizes 10,100,1000,10000
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+
+def make_docs(n: int) -> list:
+    # Stored message documents as HISTORY_PROJECTION returns them
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "sender_role": "patient" if i % 2 == 0 else "doctor",
+            "text": f"Message {i}: I have had a mild fever and a dry cough since Tuesday.",
+            "translated_text": f"Message {i}: translated text of about the same length as the original.",
+            "created_at": start + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_message(doc: dict) -> dict:
+    # to_chat_message before HistoryMessage
+    return {
+        "id": str(doc["_id"]),
+        "role": doc["sender_role"],
+        "text": doc["text"],
+        "translated_text": doc.get("translated_text"),
+        "created_at": doc.get("created_at"),
+    }
+
+
+def create_app(docs: list):
+    from fastapi import FastAPI
+    from app import history_response
+    from schemas import ChatResponse
+    from services.chat_history import to_chat_message
+
+    bench_app = FastAPI()
+
+    @bench_app.get("/pydantic", response_model=ChatResponse)
+    async def pydantic_path():
+        history = [legacy_message(doc) for doc in docs]
+        return ChatResponse(conversation_id="bench", history=history, after_cursor=None)
+
+    @bench_app.get("/orjson", response_model=ChatResponse)
+    async def orjson_path():
+        history = [to_chat_message(doc) for doc in docs]
+        return history_response({"conversation_id": "bench", "history": history, "after_cursor": None})
+
+    return bench_app
+
+
+def memory_per_message(docs: list, build) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = [build(doc) for doc in docs]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del messages
+    return used / len(docs)
+
+
+async def measure(size: int, repeat: int) -> dict:
+    import httpx
+    from services.chat_history import to_chat_message
+
+    docs = make_docs(size)
+    transport = httpx.ASGITransport(app=create_app(docs))
+    result = {"messages": size}
+    bodies = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("pydantic", "orjson"):
+            timings = []
+            for _ in range(repeat + 1):
+                began = time.perf_counter()
+                response = await client.get(f"/{path}")
+                timings.append(time.perf_counter() - began)
+            bodies[path] = response.json()
+            # First call is a warm-up
+            result[f"{path}_ms"] = round(statistics.median(timings[1:]) * 1000, 3)
+            result[f"{path}_bytes"] = len(response.content)
+    if bodies["pydantic"] != bodies["orjson"]:
+        raise SystemExit(f"Responses differ at {size} messages")
+    result["speedup"] = round(result["pydantic_ms"] / result["orjson_ms"], 2)
+    result["dict_b_per_msg"] = round(memory_per_message(docs, legacy_message))
+    result["slots_b_per_msg"] = round(memory_per_message(docs, to_chat_message))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare chat history serialization paths.")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma-separated history lengths")
+    parser.add_argument("--repeat", type=int, default=20, help="timed requests per size and path")
+    args = parser.parse_args(argv)
+
+    columns = ("messages", "pydantic_ms", "orjson_ms", "speedup", "orjson_bytes",
+               "dict_b_per_msg", "slots_b_per_msg")
+    print(" ".join(f"{c:>15}" for c in columns))
+    for size in (int(s) for s in args.sizes.split(",")):
+        # Fewer repeats for the largest histories keep the run short
+        result = asyncio.run(measure(size, max(3, min(args.repeat, args.repeat * 1000 // size))))
+        print(" ".join(f"{result[c]:>15}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,146 @@ load_dotenv()
 # Whisper model (local) - choose "tiny" or "base" depending on CPU capacity
 WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
 
+# Tiered Whisper models (smallest first). Each worker loads the default model,
+# then the other tiers smallest first while they fit the per-worker memory budget
+WHISPER_MODEL_TIERS = [m.strip() for m in os.getenv("WHISPER_MODEL_TIERS", "tiny,base,small").split(",") if m.strip()]
+WHISPER_MEMORY_BUDGET_MB = int(os.getenv("WHISPER_MEMORY_BUDGET_MB", "1536"))
+# Language-ID pass (smallest tier) over the first seconds of each clip
+WHISPER_DETECT_SECONDS = float(os.getenv("WHISPER_DETECT_SECONDS", "10"))
+# Short clips with a confident language go to the smallest tier
+WHISPER_FAST_MAX_SECONDS = float(os.getenv("WHISPER_FAST_MAX_SECONDS", "8"))
+WHISPER_FAST_MIN_LANG_PROB = float(os.getenv("WHISPER_FAST_MIN_LANG_PROB", "0.9"))
+# Unclear language -> largest tier; weak segments are re-run one tier up
+WHISPER_ESCALATE_LANG_PROB = float(os.getenv("WHISPER_ESCALATE_LANG_PROB", "0.5"))
+WHISPER_ESCALATE_LOGPROB = float(os.getenv("WHISPER_ESCALATE_LOGPROB", "-1.0"))
+
 # MongoDB connection (local by default, can be swapped with Atlas URI)
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "rural_healthcare")
 
+# MongoDB connection pool / timeouts and slow-query logging threshold
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+
 # Groq API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-GROQ_BASE_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Override to point at any OpenAI-compatible server (e.g. a local fake for testing)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+# Shared async LLM client: connection pool, concurrency, timeouts and retries
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Whisper transcription worker pool (each worker process loads its own model)
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "2"))
+WHISPER_THREADS_PER_WORKER = int(os.getenv("WHISPER_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 2) // WHISPER_WORKERS))))
+WHISPER_QUEUE_SIZE = int(os.getenv("WHISPER_QUEUE_SIZE", "16"))
+# Short clips (up to one 30 s Whisper window, after silence trimming) that
+# queue up together are decoded as one batch by a worker
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "4"))
+WHISPER_BATCH_WINDOW_MS = int(os.getenv("WHISPER_BATCH_WINDOW_MS", "50"))
+WHISPER_BATCH_MAX_SECONDS = min(30.0, float(os.getenv("WHISPER_BATCH_MAX_SECONDS", "30")))
+# Largest accepted /stt-translate/ upload (it is decoded in memory)
+STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# Streaming STT: audio is transcribed in overlapping windows of this length
+STT_STREAM_WINDOW_SEC = float(os.getenv("STT_STREAM_WINDOW_SEC", "30"))
+STT_STREAM_OVERLAP_SEC = float(os.getenv("STT_STREAM_OVERLAP_SEC", "4"))
+
+# Energy-based voice activity detection: only speech reaches Whisper
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))     # speech level above the noise floor
+VAD_FLOOR_DB = float(os.getenv("VAD_FLOOR_DB", "-50"))      # never count quieter frames as speech (dBFS)
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))    # kept around each speech region
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "500"))  # shorter pauses are not cut
+
+# Translation service: cached, coalesced GoogleTranslator calls on worker threads
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(24 * 3600)))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "8"))
+
+# Patient profile context cache (per process; entries expire after the TTL so
+# other workers pick up profile changes)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "5000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "600"))
+PROFILE_CACHE_MISS_TTL = float(os.getenv("PROFILE_CACHE_MISS_TTL", "60"))
+
+# Symptom-check response cache (Mongo-backed, expires via a TTL index)
+SYMPTOM_CACHE_ENABLED = os.getenv("SYMPTOM_CACHE_ENABLED", "true").lower() == "true"
+SYMPTOM_CACHE_TTL = int(os.getenv("SYMPTOM_CACHE_TTL", str(7 * 24 * 3600)))
+# Similarity matching over hashed character-trigram vectors
+SYMPTOM_CACHE_SIMILARITY = os.getenv("SYMPTOM_CACHE_SIMILARITY", "true").lower() == "true"
+SYMPTOM_CACHE_MIN_SIMILARITY = float(os.getenv("SYMPTOM_CACHE_MIN_SIMILARITY", "0.92"))
+SYMPTOM_CACHE_CANDIDATES = int(os.getenv("SYMPTOM_CACHE_CANDIDATES", "200"))
+
+# Structured symptom-check output: "json_object" (any Groq model) or "json_schema"
+SYMPTOM_RESPONSE_FORMAT = os.getenv("SYMPTOM_RESPONSE_FORMAT", "json_object")
+
+# Doctor chat context: recent turns verbatim + rolling summary of older turns,
+# hard-capped by an approximate token budget
+CHAT_CONTEXT_TURNS = int(os.getenv("CHAT_CONTEXT_TURNS", "6"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+CHAT_SUMMARY_FOLD_TURNS = int(os.getenv("CHAT_SUMMARY_FOLD_TURNS", "4"))
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "200"))
+# One summary update folds at most this many messages / tokens of them; a long
+# backlog (e.g. migrated histories) is folded over several turns
+CHAT_SUMMARY_FOLD_MAX_MESSAGES = int(os.getenv("CHAT_SUMMARY_FOLD_MAX_MESSAGES", "40"))
+CHAT_SUMMARY_FOLD_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_FOLD_TOKEN_BUDGET", "3000"))
+
+# Storage backend: "mongo" (central MongoDB) or "local" (embedded SQLite for
+# offline clinics; synced collections are replayed to MongoDB via an outbox)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "rural_healthcare.sqlite3")
+SYNC_INTERVAL_SEC = float(os.getenv("SYNC_INTERVAL_SEC", "30"))
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500"))
+SYNC_COLLECTIONS = [c.strip() for c in os.getenv(
+    "SYNC_COLLECTIONS", "patients,chats,messages,transcripts,symptom_checks").split(",") if c.strip()]
+
+# Observability: Prometheus metrics at /metrics, optional Server-Timing
+# response headers with the per-stage breakdown of each request
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_HEADERS = os.getenv("SERVER_TIMING_HEADERS", "false").lower() == "true"
+
+# Background jobs (submit/poll/webhook) for long STT and symptom analyses.
+# Jobs live in MongoDB; a worker holds a renewable lease on each running job,
+# so jobs of a crashed process are picked up again once the lease expires
+JOB_WORKERS_ENABLED = os.getenv("JOB_WORKERS_ENABLED", "true").lower() == "true"
+JOB_POLL_INTERVAL_SEC = float(os.getenv("JOB_POLL_INTERVAL_SEC", "1"))
+JOB_LEASE_SEC = float(os.getenv("JOB_LEASE_SEC", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Per-process concurrency per job type, e.g. "stt=2,symptom_check=8"
+JOB_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split("=") for item in
+                        os.getenv("JOB_CONCURRENCY", "stt=2,symptom_check=8").split(",") if "=" in item)
+}
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", str(7 * 24 * 3600)))
+# Audio is stored in the job document, which must stay under MongoDB's 16 MB limit
+JOB_MAX_AUDIO_BYTES = int(os.getenv("JOB_MAX_AUDIO_BYTES", str(15 * 1024 * 1024)))
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+JOB_WEBHOOK_RETRIES = int(os.getenv("JOB_WEBHOOK_RETRIES", "3"))
+# Hosts callback_url may point at, e.g. "hooks.clinic.org,emr.local"; empty
+# allows any host that resolves only to public addresses
+JOB_CALLBACK_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+
+# Optional process roles on top of the HTTP API: "stt" (Whisper pool and
+# speech endpoints) and "jobs" (background job worker). STT-free replicas
+# (e.g. SERVICE_ROLES=jobs, or empty) never import or load Whisper/torch
+SERVICE_ROLES = {r.strip() for r in os.getenv("SERVICE_ROLES", "stt,jobs").split(",") if r.strip()}
+STT_ENABLED = "stt" in SERVICE_ROLES
+# Load the Whisper workers at startup (true) or on the first STT request (false)
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() == "true"
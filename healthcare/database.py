@@ -1,9 +1,205 @@
 # database.py
+import asyncio
+import logging
+import threading
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URL, MONGO_DB_NAME
+from pymongo import ASCENDING, DESCENDING, IndexModel, monitoring
+from pymongo.errors import PyMongoError
+from metrics import observe_mongo
+from config import (
+    MONGO_URL,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SLOW_QUERY_MS,
+    SYMPTOM_CACHE_TTL,
+    JOB_RESULT_TTL,
+    STORAGE_BACKEND,
+    LOCAL_DB_PATH,
+    SYNC_INTERVAL_SEC,
+    SYNC_BATCH_SIZE,
+    SYNC_COLLECTIONS,
+)
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[MONGO_DB_NAME]
+logger = logging.getLogger("database")
+
+
+class QueryStats(monitoring.CommandListener):
+    """
+    Command listener that records per-collection latency and logs slow queries.
+    Only the shape of a slow query's filter is logged, never patient data.
+    """
+
+    def __init__(self, slow_ms: float = MONGO_SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._pending = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collection(event) -> str:
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        return target if isinstance(target, str) else None
+
+    def started(self, event):
+        collection = self._collection(event)
+        if collection:
+            shape = sorted((event.command.get("filter") or event.command.get("q") or {}).keys())
+            self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _record(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, shape = pending
+        ms = event.duration_micros / 1000
+        key = (collection, event.command_name)
+        with self._lock:
+            stat = self._stats.setdefault(key, {"count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stat["count"] += 1
+            stat["failures"] += failed
+            stat["total_ms"] += ms
+            stat["max_ms"] = max(stat["max_ms"], ms)
+        observe_mongo(collection, event.command_name, ms / 1000, failed)
+        if ms >= self.slow_ms:
+            logger.warning("Slow Mongo %s on %s: %.1f ms (filter keys: %s)",
+                           event.command_name, collection, ms, shape)
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def snapshot(self) -> dict:
+        """
+        {"collection.command": {"count", "failures", "avg_ms", "max_ms"}}
+        """
+        with self._lock:
+            return {
+                f"{collection}.{command}": {
+                    "count": s["count"],
+                    "failures": s["failures"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 3),
+                    "max_ms": round(s["max_ms"], 3),
+                }
+                for (collection, command), s in self._stats.items()
+            }
+
+
+query_stats = QueryStats()
+
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[query_stats],
+)
+mongo_db = client[MONGO_DB_NAME]
+
+if STORAGE_BACKEND == "local":
+    from local_store import LocalDatabase
+    db = LocalDatabase(LOCAL_DB_PATH, outbox_collections=SYNC_COLLECTIONS)
+else:
+    db = mongo_db
+
+# Indexes ensured at startup, per collection
+INDEXES = {
+    "patients": [
+        IndexModel([("patient_id", ASCENDING)], unique=True),
+    ],
+    "chats": [
+        IndexModel([("conversation_id", ASCENDING)], unique=True),
+    ],
+    "messages": [
+        # _id breaks ties between messages written in the same millisecond
+        IndexModel([("conversation_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "transcripts": [
+        IndexModel([("created_at", DESCENDING)]),
+        # Dedup of repeat uploads; older and streamed transcripts have no hash
+        IndexModel([("audio_sha256", ASCENDING), ("whisper_model", ASCENDING)], unique=True,
+                   partialFilterExpression={"audio_sha256": {"$exists": True}}),
+    ],
+    "symptom_checks": [
+        IndexModel([("conversation_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "symptom_cache": [
+        IndexModel([("key", ASCENDING)], unique=True),
+        IndexModel([("segment", ASCENDING), ("guard", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=SYMPTOM_CACHE_TTL),
+    ],
+    "jobs": [
+        # Claim order: status/type filter, then highest priority, oldest first
+        IndexModel([("status", ASCENDING), ("type", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)]),
+        # Finished jobs expire (queued/running ones have no finished_at)
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=JOB_RESULT_TTL),
+    ],
+}
+
+async def init_db(database=db):
+    """
+    Bootstrap step run at app startup: ensure every index exists.
+    A failing index (e.g. duplicates blocking a unique index) is logged,
+    not fatal, so the API still starts.
+    """
+    for name, indexes in INDEXES.items():
+        try:
+            await database[name].create_indexes(indexes)
+        except PyMongoError as e:
+            logger.warning("Could not ensure indexes on %s: %s", name, e)
+    print(f"✅ MongoDB indexes ensured on {len(INDEXES)} collections.")
+
+# Natural keys for outbox sync: edge and central copies of a patient or a
+# conversation are merged on these instead of on _id
+SYNC_NATURAL_KEYS = {"patients": "patient_id", "chats": "conversation_id"}
+# Counters merged as deltas. The rolling chat summary (folded on whichever
+# side holds the conversation) is merged only when it reaches further than
+# the central one: cursors are "<ms>_<ObjectId>", so they compare as strings
+SYNC_COUNTERS = {"chats": ("message_count",)}
+SYNC_GUARDED_FIELDS = {"chats": ("summary_cursor", ("summary", "summary_cursor"))}
+_sync_task = None
+_ttl_task = None
+
+def start_sync():
+    """
+    In local mode, start the background tasks that drain the outbox into
+    the central MongoDB whenever it is reachable and expire TTL-indexed
+    documents.
+    """
+    global _sync_task, _ttl_task
+    if STORAGE_BACKEND != "local" or _sync_task is not None:
+        return
+    from local_store import run_sync_loop, run_ttl_monitor
+    _sync_task = asyncio.create_task(
+        run_sync_loop(db, mongo_db, SYNC_INTERVAL_SEC, SYNC_BATCH_SIZE, SYNC_NATURAL_KEYS,
+                      SYNC_COUNTERS, SYNC_GUARDED_FIELDS)
+    )
+    _ttl_task = asyncio.create_task(run_ttl_monitor(db))
+    print(f"✅ Local store at {LOCAL_DB_PATH}; syncing {', '.join(SYNC_COLLECTIONS)} to MongoDB.")
+
+async def stop_sync():
+    global _sync_task, _ttl_task
+    for task in (_sync_task, _ttl_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _sync_task = _ttl_task = None
 
 # Dependency for FastAPI
 async def get_db():
@@ -0,0 +1,752 @@
+# local_store.py
+# Embedded SQLite storage backend for offline (edge) clinics. It implements
+# the subset of the Motor collection API this app uses, so services run
+# unchanged on top of it. Writes to synced collections also go to an outbox
+# that is replayed into the central MongoDB when the link is back.
+import asyncio
+import copy
+import logging
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from bson import ObjectId, json_util
+from pymongo import UpdateOne, ReplaceOne, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+
+logger = logging.getLogger("local_store")
+
+_MISSING = object()
+_name_re = re.compile(r"[^A-Za-z0-9_]")
+# Dates are stored as {"$date": <epoch ms>}, so SQL can compare and index them
+JSON_OPTIONS = json_util.LEGACY_JSON_OPTIONS
+_EPOCH = datetime(1970, 1, 1)
+_SQL_OPS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# How often expired documents of TTL-indexed collections are deleted (as in MongoDB)
+TTL_PURGE_INTERVAL_SEC = 60
+
+
+# -------------------------------
+# Document matching / updates (Mongo semantics, the subset we use)
+# -------------------------------
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def _compare(value, op: str, target) -> bool:
+    if value is _MISSING or value is None or target is None:
+        return False
+    try:
+        return {"$gt": value > target, "$gte": value >= target,
+                "$lt": value < target, "$lte": value <= target}[op]
+    except TypeError:
+        return False
+
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, target in condition.items():
+            if op == "$in":
+                if (None if value is _MISSING else value) not in target:
+                    return False
+            elif op == "$nin":
+                if (None if value is _MISSING else value) in target:
+                    return False
+            elif op == "$ne":
+                if (None if value is _MISSING else value) == target:
+                    return False
+            elif op == "$not":
+                if _match_value(value, target):
+                    return False
+            elif op == "$exists":
+                if (value is not _MISSING) != bool(target):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if not _compare(value, op, target):
+                    return False
+            else:
+                raise NotImplementedError(f"local store does not support {op}")
+        return True
+    if value is _MISSING:
+        return condition is None
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    if not any(k.startswith("$") for k in update):
+        # Replacement document
+        return {"_id": doc.get("_id"), **copy.deepcopy(update)}
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$push":
+                current = _get(doc, path)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                _set(doc, path, (list(current) if current is not _MISSING else []) + copy.deepcopy(items))
+            elif op != "$setOnInsert":
+                raise NotImplementedError(f"local store does not support {op}")
+    return doc
+
+
+def _upsert_seed(query: dict) -> dict:
+    # Equality fields of the filter become part of an upserted document
+    seed = {}
+    for key, value in query.items():
+        if key.startswith("$") or (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+            continue
+        _set(seed, key, copy.deepcopy(value))
+    return seed
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+def _sort_key(fields: list):
+    def key(doc):
+        parts = []
+        for name, direction in fields:
+            value = _get(doc, name)
+            rank = (0, None) if value in (_MISSING, None) else (1, value)
+            parts.append(_Reversed(rank) if direction < 0 else rank)
+        return parts
+    return key
+
+
+class _Reversed:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+# -------------------------------
+# SQL pushdown
+# -------------------------------
+def _field_sql(field: str) -> str:
+    # Dates compare as their epoch ms, other scalars as themselves
+    return f"""COALESCE(json_extract(doc, '$.{field}."$date"'), json_extract(doc, '$.{field}'))"""
+
+
+def _millis(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(milliseconds=1)
+
+
+def _sql_param(value):
+    # None for values SQL cannot compare like matches() does (left to matches())
+    if isinstance(value, datetime):
+        return _millis(value)
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _condition_sql(field: str, condition) -> tuple:
+    """
+    SQL for one field condition, or None. The SQL may match more rows than
+    the condition (matches() re-checks every row), never fewer.
+    """
+    column = _field_sql(field)
+    param = _sql_param(condition)
+    if param is not None:
+        return f"{column} = ?", [param]
+    if not isinstance(condition, dict) or not condition:
+        return None
+    clauses, params = [], []
+    for op, target in condition.items():
+        if op == "$in" and target and all(_sql_param(v) is not None for v in target):
+            clauses.append(f"{column} IN ({','.join('?' * len(target))})")
+            params.extend(_sql_param(v) for v in target)
+        elif op in _SQL_OPS and _sql_param(target) is not None:
+            sql_op = _SQL_OPS[op]
+            if isinstance(target, datetime) and op == "$lt":
+                # Stored dates are truncated to ms: d < 12:00:00.000900 holds for d = 12:00:00.000
+                sql_op = "<="
+            clauses.append(f"{column} {sql_op} ?")
+            params.append(_sql_param(target))
+    return (" AND ".join(clauses), params) if clauses else None
+
+
+# -------------------------------
+# Cursor / collection / database
+# -------------------------------
+class LocalCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def _results(self) -> list:
+        docs = self._collection._select(self._query)
+        if self._sort:
+            docs.sort(key=_sort_key(self._sort))
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        docs = await self._collection.database.run(self._results)
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+class LocalCollection:
+    """
+    Motor-style collection. The async methods hand their SQLite work to the
+    database's single thread; the underscored helpers run on that thread.
+    """
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.table = f"c_{_name_re.sub('_', name)}"
+        self._conn = database.conn
+        self._created = False
+        self.synced = name in database.outbox_collections
+        # Fields with an expression index; conditions on these are pushed down to SQL
+        self._indexed = set()
+        # TTL index: (date field, seconds)
+        self.ttl = None
+
+    # ---- storage helpers (database thread) ----
+    def _ensure_table(self):
+        if not self._created:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" (id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+            self._created = True
+
+    def _pushdown(self, query: dict) -> tuple:
+        # Conditions on indexed (scalar) fields run in SQL so the expression
+        # index applies, including inside $and / $or; matches() re-checks every row
+        clauses, params = [], []
+        for key, value in (query or {}).items():
+            if key == "$and":
+                for sub in value:
+                    where, sub_params = self._pushdown(sub)
+                    if where:
+                        clauses.append(where)
+                        params.extend(sub_params)
+            elif key == "$or":
+                branches = [self._pushdown(sub) for sub in value]
+                # Only if every branch narrows, or the OR would drop matches
+                if branches and all(where for where, _ in branches):
+                    clauses.append("(" + " OR ".join(f"({where})" for where, _ in branches) + ")")
+                    for _, sub_params in branches:
+                        params.extend(sub_params)
+            elif key in self._indexed:
+                sql = _condition_sql(key, value)
+                if sql:
+                    clauses.append(sql[0])
+                    params.extend(sql[1])
+        return " AND ".join(clauses), params
+
+    def _select(self, query: dict) -> list:
+        self._ensure_table()
+        where, params = self._pushdown(query)
+        where = f" WHERE {where}" if where else ""
+        rows = self._conn.execute(f'SELECT doc FROM "{self.table}"{where}', params).fetchall()
+        docs = (json_util.loads(row[0]) for row in rows)
+        return [doc for doc in docs if matches(doc, query)]
+
+    def _write(self, doc: dict, replace: bool):
+        self._ensure_table()
+        encoded = json_util.dumps(doc, json_options=JSON_OPTIONS)
+        try:
+            if replace:
+                # Not INSERT OR REPLACE: that would silently delete another
+                # row holding the same value of a unique index
+                self._conn.execute(f'UPDATE "{self.table}" SET doc = ? WHERE id = ?',
+                                   (encoded, json_util.dumps(doc["_id"])))
+            else:
+                self._conn.execute(f'INSERT INTO "{self.table}" (id, doc) VALUES (?, ?)',
+                                   (json_util.dumps(doc["_id"]), encoded))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} ({e})", 11000)
+        if self.synced:
+            self._conn.execute(
+                "INSERT INTO outbox (collection, doc_id, doc, created_at) VALUES (?, ?, ?, ?)",
+                (self.name, json_util.dumps(doc["_id"]), encoded, time.time()),
+            )
+
+    def _delete(self, doc: dict):
+        self._conn.execute(f'DELETE FROM "{self.table}" WHERE id = ?', (json_util.dumps(doc["_id"]),))
+
+    def _create_indexes(self, indexes: list):
+        self._ensure_table()
+        for index in indexes:
+            spec = index.document
+            fields = [field for field in spec["key"] if field != "_id"]
+            if not fields:
+                continue
+            self._indexed.update(field for field in fields if "." not in field)
+            if "expireAfterSeconds" in spec:
+                # Enforced by purge_expired(), like MongoDB's TTL monitor
+                self.ttl = (fields[0], spec["expireAfterSeconds"])
+            unique = "UNIQUE " if spec.get("unique") else ""
+            columns = ", ".join(_field_sql(field) for field in fields)
+            self._conn.execute(
+                f'CREATE {unique}INDEX IF NOT EXISTS "{self.table}_{_name_re.sub("_", spec["name"])}" '
+                f'ON "{self.table}" ({columns})'
+            )
+
+    def _purge_expired(self) -> int:
+        field, seconds = self.ttl
+        cutoff = _millis(datetime.utcnow() - timedelta(seconds=seconds))
+        with self._conn:
+            cursor = self._conn.execute(
+                f"""DELETE FROM "{self.table}" WHERE json_extract(doc, '$.{field}."$date"') < ?""", (cutoff,)
+            )
+        return cursor.rowcount
+
+    def _count(self, query: dict, limit: int) -> int:
+        count = len(self._select(query))
+        return min(count, limit) if limit else count
+
+    def _insert_one(self, doc: dict):
+        with self._conn:
+            self._write(doc, replace=False)
+
+    def _insert_many(self, docs: list, ordered: bool) -> tuple:
+        inserted, errors = [], []
+        with self._conn:
+            for i, doc in enumerate(docs):
+                try:
+                    self._write(doc, replace=False)
+                    inserted.append(doc["_id"])
+                except DuplicateKeyError as e:
+                    errors.append({"index": i, "code": 11000, "errmsg": str(e), "op": doc})
+                    if ordered:
+                        break
+        return inserted, errors
+
+    def _update(self, query: dict, update: dict, upsert: bool, sort=None, many: bool = False):
+        with self._conn:
+            docs = self._select(query)
+            if sort:
+                docs.sort(key=_sort_key(sort))
+            if not many:
+                docs = docs[:1]
+            if docs:
+                updated = []
+                for doc in docs:
+                    before = copy.deepcopy(doc)
+                    after = apply_update(doc, update)
+                    self._write(after, replace=True)
+                    updated.append((before, after))
+                return updated, None
+            if upsert:
+                doc = apply_update(_upsert_seed(query), update, inserting=True)
+                doc.setdefault("_id", ObjectId())
+                self._write(doc, replace=False)
+                return [(None, doc)], doc["_id"]
+            return [], None
+
+    def _delete_matching(self, query: dict, many: bool) -> int:
+        with self._conn:
+            docs = self._select(query)
+            if not many:
+                docs = docs[:1]
+            for doc in docs:
+                self._delete(doc)
+        return len(docs)
+
+    # ---- Motor-compatible API ----
+    async def create_indexes(self, indexes: list):
+        await self.database.run(self._create_indexes, indexes)
+
+    async def create_index(self, keys, **kwargs):
+        from pymongo import IndexModel
+        await self.create_indexes([IndexModel(keys, **kwargs)])
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection).limit(1)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    def find(self, query=None, projection=None):
+        return LocalCursor(self, query, projection)
+
+    async def count_documents(self, query, limit: int = 0, **kwargs) -> int:
+        return await self.database.run(self._count, query, limit)
+
+    async def insert_one(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        await self.database.run(self._insert_one, doc)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    async def insert_many(self, docs: list, ordered: bool = True):
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        inserted, errors = await self.database.run(self._insert_many, docs, ordered)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted, acknowledged=True)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        updated, upserted_id = await self.database.run(self._update, query, update, upsert)
+        matched = 0 if upserted_id else len(updated)
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False):
+        updated, upserted_id = await self.database.run(self._update, query, update, upsert, None, True)
+        matched = 0 if upserted_id else len(updated)
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        return await self.update_one(query, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection=None, sort=None,
+                                  upsert: bool = False, return_document=ReturnDocument.BEFORE):
+        updated, _ = await self.database.run(self._update, query, update, upsert, sort)
+        if not updated:
+            return None
+        before, after = updated[0]
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return _project(doc, projection) if doc else None
+
+    async def delete_one(self, query: dict):
+        return SimpleNamespace(deleted_count=await self.database.run(self._delete_matching, query, False))
+
+    async def delete_many(self, query: dict):
+        return SimpleNamespace(deleted_count=await self.database.run(self._delete_matching, query, True))
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        errors = []
+        for i, op in enumerate(requests):
+            try:
+                if isinstance(op, InsertOne):
+                    await self.insert_one(op._doc)
+                elif isinstance(op, (UpdateOne, ReplaceOne)):
+                    await self.update_one(op._filter, op._doc, upsert=op._upsert)
+                else:
+                    raise NotImplementedError(f"local store does not support {type(op).__name__}")
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e), "op": op})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return SimpleNamespace(acknowledged=True)
+
+
+class LocalDatabase:
+    """
+    SQLite-backed stand-in for a Motor database (one table of JSON documents
+    per collection). Every SQLite call runs on one dedicated thread, so the
+    event loop never blocks on disk and each operation (e.g. a claim's
+    read-modify-write) still runs alone.
+    """
+
+    def __init__(self, path: str, outbox_collections=()):
+        self.path = path
+        self.outbox_collections = set(outbox_collections)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL: readers never block on the writer; NORMAL fsyncs at checkpoints only
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, "
+            "doc_id TEXT NOT NULL, doc TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Entries the central database rejected (e.g. a unique-index conflict),
+        # kept for inspection and requeue_dead_letters()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_dead ("
+            "seq INTEGER PRIMARY KEY, collection TEXT NOT NULL, doc_id TEXT NOT NULL, "
+            "doc TEXT NOT NULL, created_at REAL NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL)"
+        )
+        # Counter values last sent to the central database (see sync_outbox)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced_counters ("
+            "collection TEXT NOT NULL, doc_id TEXT NOT NULL, counters TEXT NOT NULL, "
+            "PRIMARY KEY (collection, doc_id))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('edge_id', ?)", (str(ObjectId()),))
+        self.edge_id = self.conn.execute("SELECT value FROM meta WHERE key = 'edge_id'").fetchone()[0]
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-store")
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> LocalCollection:
+        if name not in self._collections:
+            self._collections[name] = LocalCollection(self, name)
+        return self._collections[name]
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the database thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def command(self, name: str, *args, **kwargs) -> dict:
+        # Only "ping" (used by health checks) makes sense for a local file
+        if name != "ping":
+            # Same error (code 59, CommandNotFound) MongoDB gives, so PyMongoError handlers catch it
+            raise OperationFailure(f"no such command: {name!r} (local store)", code=59)
+        await self.run(self.conn.execute, "SELECT 1")
+        return {"ok": 1.0}
+
+    def pending_outbox(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self) -> list:
+        """
+        Outbox entries the central database rejected: [(seq, collection, doc_id, error), ...].
+        """
+        return self.conn.execute(
+            "SELECT seq, collection, doc_id, error FROM outbox_dead ORDER BY seq"
+        ).fetchall()
+
+    def requeue_dead_letters(self) -> int:
+        """
+        Move rejected entries back into the outbox (once the conflict is
+        resolved centrally). Returns the number requeued.
+        """
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO outbox (collection, doc_id, doc, created_at) "
+                "SELECT collection, doc_id, doc, created_at FROM outbox_dead ORDER BY seq"
+            )
+            return self.conn.execute("DELETE FROM outbox_dead").rowcount
+
+    async def purge_expired(self) -> int:
+        """
+        Delete documents past their TTL index's expiry. Returns the number deleted.
+        """
+        ttl_collections = [c for c in self._collections.values() if c.ttl]
+        return sum([await self.run(c._purge_expired) for c in ttl_collections])
+
+
+# -------------------------------
+# Outbox sync to the central MongoDB
+# -------------------------------
+def _read_outbox(local: LocalDatabase, batch_size: int) -> list:
+    return local.conn.execute(
+        "SELECT seq, collection, doc_id, doc FROM outbox ORDER BY seq LIMIT ?", (batch_size,)
+    ).fetchall()
+
+
+def _synced_counters(local: LocalDatabase, collection: str, doc_id: str) -> dict:
+    row = local.conn.execute(
+        "SELECT counters FROM synced_counters WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+    ).fetchone()
+    return json_util.loads(row[0]) if row else {}
+
+
+def _mark_synced(local: LocalDatabase, last_seq: int, counters: list, failed: dict):
+    # Rejected documents go to the dead-letter table, everything else is done
+    with local.conn:
+        local.conn.executemany(
+            "INSERT OR REPLACE INTO synced_counters (collection, doc_id, counters) VALUES (?, ?, ?)",
+            [(collection, doc_id, json_util.dumps(values)) for collection, doc_id, values in counters
+             if (collection, doc_id) not in failed],
+        )
+        now = time.time()
+        local.conn.executemany(
+            "INSERT INTO outbox_dead (seq, collection, doc_id, doc, created_at, error, failed_at) "
+            "SELECT seq, collection, doc_id, doc, created_at, ?, ? FROM outbox "
+            "WHERE seq <= ? AND collection = ? AND doc_id = ?",
+            [(error, now, last_seq, collection, doc_id) for (collection, doc_id), error in failed.items()],
+        )
+        local.conn.execute("DELETE FROM outbox WHERE seq <= ?", (last_seq,))
+
+
+async def sync_outbox(local: LocalDatabase, remote, batch_size: int, natural_keys: dict,
+                      counters: dict = None, guarded_fields: dict = None) -> int:
+    """
+    Replay one batch of outbox entries into the central database.
+    Only the latest version of each document is sent. Writes are idempotent
+    upserts (by _id, or by the collection's natural key), so a batch that is
+    interrupted and resent does no harm. Entries the central database
+    rejects (e.g. a unique-index conflict with another edge's write) move to
+    the outbox_dead table instead of being retried forever. Returns the
+    number of entries processed.
+
+    Natural-key merges add the local change of each `counters[collection]`
+    field with $inc, so increments made on other edges are kept. The $inc is
+    guarded by this edge's last synced outbox seq, stored on the central
+    document, so a resent batch counts once. `guarded_fields[collection]` is
+    (guard, fields): those fields are only written when the edge's guard
+    value is greater than the central one (e.g. a chat summary that covers
+    more of the conversation), after the document itself is merged.
+    """
+    counters, guarded_fields = counters or {}, guarded_fields or {}
+    rows = await local.run(_read_outbox, local, batch_size)
+    if not rows:
+        return 0
+
+    latest = {}
+    for seq, collection, doc_id, doc in rows:
+        latest[(collection, doc_id)] = (seq, doc)
+    ops, guarded_ops, synced = {}, {}, []
+    # Per collection, the outbox document each op writes (bulk error index -> document)
+    op_docs, guarded_docs = {}, {}
+    for (collection, doc_id), (seq, encoded) in latest.items():
+        doc = json_util.loads(encoded)
+        key = natural_keys.get(collection)
+        if key and key in doc:
+            guard, fields = guarded_fields.get(collection, (None, ()))
+            skip = {"_id", *fields, *counters.get(collection, ())}
+            update = {"$set": {k: v for k, v in doc.items() if k not in skip}}
+            query = {key: doc[key]}
+            if counters.get(collection):
+                values = {name: doc.get(name, 0) for name in counters[collection]}
+                base = await local.run(_synced_counters, local, collection, doc_id)
+                update["$inc"] = {name: value - base.get(name, 0) for name, value in values.items()}
+                marker = f"synced_seq.{local.edge_id}"
+                update["$set"][marker] = seq
+                query[marker] = {"$not": {"$gte": seq}}
+                synced.append((collection, doc_id, values))
+            op = UpdateOne(query, update, upsert=True)
+            if guard and doc.get(guard) is not None:
+                newer = {key: doc[key], "$or": [{guard: None}, {guard: {"$lt": doc[guard]}}]}
+                guarded_ops.setdefault(collection, []).append(
+                    UpdateOne(newer, {"$set": {name: doc[name] for name in fields if name in doc}})
+                )
+                guarded_docs.setdefault(collection, []).append(doc_id)
+        else:
+            op = ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+        ops.setdefault(collection, []).append(op)
+        op_docs.setdefault(collection, []).append(doc_id)
+
+    failed = {}
+    for collection, collection_ops, doc_ids in [
+        *((c, o, op_docs[c]) for c, o in ops.items()),
+        *((c, o, guarded_docs[c]) for c, o in guarded_ops.items()),
+    ]:
+        try:
+            await remote[collection].bulk_write(collection_ops, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                op = collection_ops[err["index"]]
+                if err.get("code") == 11000 and "$inc" in op._doc:
+                    # A resent counter merge: its seq guard fails and the upsert
+                    # hits the natural key, because it was already applied
+                    continue
+                # Conflicts will not resolve by retrying
+                logger.warning("Outbox sync conflict in %s, entry dead-lettered: %s", collection, err.get("errmsg"))
+                failed[(collection, doc_ids[err["index"]])] = err.get("errmsg", "write error")
+
+    await local.run(_mark_synced, local, rows[-1][0], synced, failed)
+    return len(rows)
+
+
+async def run_sync_loop(local: LocalDatabase, remote, interval: float, batch_size: int, natural_keys: dict,
+                        counters: dict = None, guarded_fields: dict = None):
+    """
+    Background task: drain the outbox whenever the central MongoDB is reachable.
+    """
+    while True:
+        try:
+            if await local.run(local.pending_outbox):
+                await remote.command("ping")
+                while await sync_outbox(local, remote, batch_size, natural_keys,
+                                        counters, guarded_fields) == batch_size:
+                    pass
+        except PyMongoError as e:
+            logger.info("Central MongoDB unreachable, outbox kept for later: %s", e)
+        except Exception:
+            logger.exception("Outbox sync failed")
+        await asyncio.sleep(interval)
+
+
+async def run_ttl_monitor(local: LocalDatabase, interval: float = TTL_PURGE_INTERVAL_SEC):
+    """
+    Background task: expire documents of TTL-indexed collections.
+    """
+    while True:
+        try:
+            deleted = await local.purge_expired()
+            if deleted:
+                logger.info("Expired %d local documents", deleted)
+        except Exception:
+            logger.exception("TTL purge failed")
+        await asyncio.sleep(interval)
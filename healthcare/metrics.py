@@ -0,0 +1,107 @@
+# metrics.py
+# Prometheus metrics and per-request stage timing.
+import time
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from config import METRICS_ENABLED, SERVER_TIMING_HEADERS
+
+# Stages every request is broken down into
+STAGES = ("translate_in", "llm", "translate_out", "db_read", "db_write", "whisper")
+
+# Buckets cover sub-ms cache hits up to slow LLM calls and long transcriptions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_LATENCY = Histogram(
+    "healthcare_request_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "healthcare_stage_seconds", "Latency of one stage inside a request",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+MONGO_COMMANDS = Counter(
+    "healthcare_mongo_commands_total", "MongoDB commands by collection and outcome",
+    ["collection", "command", "outcome"],
+)
+MONGO_LATENCY = Histogram(
+    "healthcare_mongo_command_seconds", "MongoDB command latency",
+    ["collection", "command"], buckets=LATENCY_BUCKETS,
+)
+
+# Labelled children resolved once, so a span costs two clock reads and an observe()
+_stage_histograms = {stage: STAGE_LATENCY.labels(stage) for stage in STAGES}
+
+# Stage -> accumulated seconds for the current request (set by the middleware)
+_request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+
+class span:
+    """
+    Time a stage: `with span("llm"): ...`. Records the stage histogram and,
+    inside a request, adds to that request's Server-Timing breakdown.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if METRICS_ENABLED:
+            _stage_histograms[self.stage].observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def observe_mongo(collection: str, command: str, seconds: float, failed: bool):
+    """
+    Hook for database.QueryStats: one call per finished Mongo command.
+    """
+    if METRICS_ENABLED:
+        MONGO_COMMANDS.labels(collection, command, "failure" if failed else "success").inc()
+        MONGO_LATENCY.labels(collection, command).observe(seconds)
+
+
+def server_timing(timings: dict, total: float) -> str:
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+async def timing_middleware(request, call_next):
+    """
+    HTTP middleware: request latency histogram plus an optional Server-Timing
+    header. Streaming responses only report stages finished before the
+    first byte, since headers go out first.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if SERVER_TIMING_HEADERS:
+            response.headers["Server-Timing"] = server_timing(timings, time.perf_counter() - start)
+        return response
+    finally:
+        _request_timings.reset(token)
+        if METRICS_ENABLED:
+            # Route template, not the raw path, keeps label cardinality bounded
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> tuple:
+    """
+    (body, content type) for the /metrics endpoint.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
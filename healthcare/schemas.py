@@ -3,10 +3,17 @@ from datetime import datetime
 from typing import Optional, List
 
 # ---------- STT + Translation ----------
+# Target language codes ("en", "sw", "zh-CN", "mni-Mtei"); also used as a
+# stored field name (transcripts.translations.<code>), so nothing else passes
+LANG_CODE_PATTERN = r"^[a-z]{2,3}(-[A-Za-z]{2,4})?$"
+
 class STTResponse(BaseModel):
     original_text: str
     translated_text: str
     target_lang: str
+    language: Optional[str] = None  # detected spoken language
+    model: Optional[str] = None     # Whisper tier that produced the transcript
+    cache_hit: bool = False         # same audio was transcribed before
 
 
 # ---------- Message / Chat ----------
@@ -28,6 +35,8 @@ class ChatMessage(BaseModel):
     role: str  # "patient" or "doctor"
     text: str
     translated_text: Optional[str] = None
+    id: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 
 class ChatRequest(BaseModel):
@@ -35,11 +44,19 @@ class ChatRequest(BaseModel):
     message: str
     source_lang: str = "auto"  # patient input language
     target_lang: str = "en"    # language for AI processing
+    # after_cursor from an earlier response: return only the newer messages
+    history_after: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     conversation_id: str
     history: List[ChatMessage]
+    after_cursor: Optional[str] = None   # pass as history_after / ?after= for newer messages
+
+
+class ChatHistoryPage(ChatResponse):
+    has_more: bool = False
+    before_cursor: Optional[str] = None  # pass as ?before= for older messages
 
 
 # ---------- Transcript ----------
@@ -62,6 +79,7 @@ class SymptomCheckRequest(BaseModel):
     language: Optional[str] = "en"
     age: Optional[int] = None
     sex: Optional[str] = None
+    use_cache: bool = True  # set False to force a fresh analysis
 
 
 class SymptomCheckResponse(BaseModel):
@@ -72,6 +90,7 @@ class SymptomCheckResponse(BaseModel):
     recommendations: List[str]
     recommended_tests: List[str] = []
     recommended_medicines: List[str] = []
+    cache_hit: bool = False
 
 
 # ---------- Patient Profiles ----------
@@ -88,3 +107,41 @@ class PatientProfileCreate(BaseModel):
 class PatientProfileResponse(PatientProfileCreate):
     id: str = Field(..., alias="_id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class PatientBatchRequest(BaseModel):
+    patient_ids: List[str]
+
+
+class PatientBatchResponse(BaseModel):
+    patients: List[PatientProfileResponse]
+    missing: List[str] = []
+
+
+class BulkImportError(BaseModel):
+    row: int  # line number in the uploaded file
+    error: str
+
+
+class BulkImportResponse(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkImportError] = []
+
+
+# ---------- Background jobs ----------
+class SymptomCheckJobRequest(SymptomCheckRequest):
+    priority: int = 0                   # higher runs first (e.g. urgent cases)
+    callback_url: Optional[str] = None  # receives the final job status by POST
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    type: str                       # "stt" or "symptom_check"
+    status: str                     # queued, running, done or failed
+    priority: int = 0
+    attempts: int = 0
+    result: Optional[dict] = None   # STTResponse / SymptomCheckResponse fields when done
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,180 @@
+# services/audio.py
+# In-memory audio preprocessing before Whisper: format sniffing, decoding to
+# 16 kHz mono float32, and energy-based voice-activity trimming.
+import asyncio
+import io
+import wave
+import numpy as np
+from config import VAD_ENABLED, VAD_FRAME_MS, VAD_MARGIN_DB, VAD_FLOOR_DB, VAD_PADDING_MS, VAD_MIN_SILENCE_MS
+
+SAMPLE_RATE = 16000          # what Whisper expects
+REGION_GAP_SEC = 0.1         # silence kept between trimmed speech regions
+
+
+class UndecodableAudio(ValueError):
+    """Raised when an upload is not audio ffmpeg can decode (maps to HTTP 422)."""
+
+
+def sniff_format(data: bytes):
+    """
+    Container format from the leading bytes, or None if unknown.
+    """
+    head = data[:16]
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def resample(audio: np.ndarray, rate: int) -> np.ndarray:
+    """
+    Band-limited (FFT) resampling to 16 kHz.
+    """
+    if rate == SAMPLE_RATE or len(audio) == 0:
+        return audio
+    n_out = int(round(len(audio) * SAMPLE_RATE / rate))
+    spectrum = np.fft.rfft(audio)
+    bins = n_out // 2 + 1
+    if bins > len(spectrum):
+        spectrum = np.pad(spectrum, (0, bins - len(spectrum)))
+    return (np.fft.irfft(spectrum[:bins], n_out) * (n_out / len(audio))).astype(np.float32)
+
+
+def decode_wav(data: bytes):
+    """
+    Decode integer PCM WAV with numpy. Returns 16 kHz mono float32, or None
+    for WAV variants the stdlib reader does not handle (float, A-law, ...).
+    """
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+
+    if width == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].astype(np.int32) << 16))
+        audio = (np.where(ints & 0x800000, ints - 0x1000000, ints)).astype(np.float32) / 8388608
+    elif width == 4:
+        audio = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        return None
+
+    if channels > 1:
+        audio = audio[:len(audio) - len(audio) % channels].reshape(-1, channels).mean(axis=1)
+    return resample(audio, rate)
+
+
+async def decode_with_ffmpeg(data: bytes) -> np.ndarray:
+    """
+    Decode any format ffmpeg knows through pipes (no temp files).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate(data)
+    if proc.returncode != 0:
+        raise UndecodableAudio(f"Could not decode audio: {err.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(out, dtype=np.float32)
+
+
+async def decode_audio(data: bytes) -> np.ndarray:
+    """
+    Decode an uploaded clip to 16 kHz mono float32. PCM WAV is decoded in
+    process (off the event loop); everything else goes through ffmpeg.
+    """
+    if sniff_format(data) == "wav":
+        audio = await asyncio.to_thread(decode_wav, data)
+        if audio is not None:
+            return audio
+    return await decode_with_ffmpeg(data)
+
+
+def speech_regions(audio: np.ndarray, frame_ms: int = VAD_FRAME_MS, margin_db: float = VAD_MARGIN_DB,
+                   floor_db: float = VAD_FLOOR_DB, padding_ms: int = VAD_PADDING_MS,
+                   min_silence_ms: int = VAD_MIN_SILENCE_MS) -> list:
+    """
+    Energy VAD: [(start_sample, end_sample), ...] of speech.
+    A frame is speech when its RMS level clears an adaptive threshold: a
+    margin over the noise floor (10th percentile level), capped below the
+    loudest frame so all-speech clips keep their quiet parts, and never
+    below an absolute floor.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    level_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_db = np.percentile(level_db, 10)
+    threshold = max(floor_db, min(noise_db + margin_db, level_db.max() - 2 * margin_db))
+    speech = level_db > threshold
+    if not speech.any():
+        return []
+
+    # Regions of consecutive speech frames, then bridge short pauses and pad
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    regions = list(zip(edges[::2], edges[1::2]))
+    pad = padding_ms // frame_ms
+    min_gap = min_silence_ms // frame_ms
+    merged = [regions[0]]
+    for start, end in regions[1:]:
+        if start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return [
+        (int(max(0, start - pad) * frame), int(min(len(audio), (end + pad) * frame)))
+        for start, end in merged
+    ]
+
+
+def trim_silence(audio: np.ndarray) -> np.ndarray:
+    """
+    Keep only speech regions (joined by a short gap). Returns an empty
+    array when the clip has no speech.
+    """
+    if not VAD_ENABLED:
+        return audio
+    regions = speech_regions(audio)
+    if not regions:
+        return audio[:0]
+    if len(regions) == 1:
+        return audio[regions[0][0]:regions[0][1]]
+    gap = np.zeros(int(REGION_GAP_SEC * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    for start, end in regions:
+        parts += [audio[start:end], gap]
+    return np.concatenate(parts[:-1])
+
+
+def has_speech(audio: np.ndarray) -> bool:
+    return not VAD_ENABLED or bool(speech_regions(audio))
+
+
+async def preprocess(data: bytes) -> np.ndarray:
+    """
+    Upload bytes -> trimmed 16 kHz mono float32 speech, ready for Whisper.
+    """
+    audio = await decode_audio(data)
+    return await asyncio.to_thread(trim_silence, audio)
@@ -1,73 +1,160 @@
-import requests
-from deep_translator import GoogleTranslator
-from config import GROQ_API_KEY, GROQ_MODEL, GROQ_BASE_URL
-from schemas import ChatRequest, ChatResponse, ChatMessage
-
-
-async def doctor_patient_chat(request: ChatRequest, db) -> ChatResponse:
+import asyncio
+import re
+from collections import deque
+from config import GROQ_API_KEY
+from schemas import ChatRequest
+from models import message_model
+from services.llm_client import get_llm_client
+from services.profile_context import get_profile_context
+from services.translation import translate
+from services.chat_history import append_messages, load_history_since
+from services.chat_context import build_context, schedule_fold
+from metrics import span
+
+# Sentence end: terminal punctuation (incl. Devanagari danda) followed by whitespace
+_sentence_end = re.compile(r"[.!?।]+[\"')\]]*(\s+)|\n+")
+
+
+async def _prepare_turn(request: ChatRequest, db) -> tuple:
+    """
+    Steps shared by the blocking and streaming chat: translate the patient
+    message and build the LLM messages with conversation context.
+    Returns (patient_msg_en, messages).
+    """
     if not GROQ_API_KEY:
         raise ValueError("Missing GROQ_API_KEY in environment.")
 
     # Step 1: Translate patient message -> English
-    patient_msg_en = GoogleTranslator(source="auto", target=request.target_lang).translate(request.message)
+    with span("translate_in"):
+        patient_msg_en = await translate(request.message, "auto", request.target_lang)
 
     # -------------------------
     # Fetch patient profile
     # -------------------------
-    profile = await db["patients"].find_one({"patient_id": request.conversation_id})
-    profile_context = ""
-    if profile:
-        allergies = ", ".join(profile.get("allergies", []))
-        chronic = ", ".join(profile.get("chronic_conditions", []))
-        meds = ", ".join(profile.get("medications", []))
-        profile_context = f"\n\nPatient Profile:\n- Age: {profile.get('age')}\n- Sex: {profile.get('sex')}\n- Allergies: {allergies}\n- Chronic Conditions: {chronic}\n- Current Medications: {meds}"
-
-    # Step 2: Send to Groq AI
-    prompt = f"""
-Patient message (in English): {patient_msg_en}
-{profile_context}
+    with span("db_read"):
+        profile_context = (await get_profile_context(db, request.conversation_id)).prompt
 
+    # Step 2: Build the prompt for Groq AI (bounded recent turns + rolling summary)
+    system_prompt = f"""
 Task: You are a doctor in a rural telemedicine setting.
 Respond clearly and simply, avoiding medical jargon.
 Always include follow-up questions if needed.
+{profile_context}
 """
+    with span("db_read"):
+        messages = await build_context(db, request.conversation_id, system_prompt, patient_msg_en)
+    return patient_msg_en, messages
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
-    data = {
-        "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.6
-    }
+async def _save_turn(request: ChatRequest, db, patient_msg_en: str,
+                     doctor_msg_en: str, doctor_msg_patient_lang: str) -> list:
+    # Prepare chat messages and append them (no read-modify-write of the history)
+    patient_entry = message_model(request.conversation_id, "patient", request.message,
+                                  translated_text=patient_msg_en, language=request.source_lang)
+    doctor_entry = message_model(request.conversation_id, "doctor", doctor_msg_patient_lang,
+                                 translated_text=doctor_msg_en, language=request.source_lang)
+    with span("db_write"):
+        await append_messages(db, request.conversation_id, [patient_entry, doctor_entry])
+    schedule_fold(db, request.conversation_id)
+    return [patient_entry, doctor_entry]
 
-    resp = requests.post(GROQ_BASE_URL, headers=headers, json=data)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Groq API error: {resp.text}")
 
-    doctor_msg_en = resp.json()["choices"][0]["message"]["content"]
+async def doctor_patient_chat(request: ChatRequest, db) -> dict:
+    patient_msg_en, messages = await _prepare_turn(request, db)
 
-    # Step 3: Translate doctor response back to patient language
-    doctor_msg_patient_lang = GoogleTranslator(source="auto", target=request.source_lang).translate(doctor_msg_en)
+    with span("llm"):
+        doctor_msg_en = await get_llm_client().chat(messages, temperature=0.6)
 
-    # Step 4: Prepare chat messages
-    patient_entry = ChatMessage(role="patient", text=request.message, translated_text=patient_msg_en)
-    doctor_entry = ChatMessage(role="doctor", text=doctor_msg_patient_lang, translated_text=doctor_msg_en)
-
-    # Step 5: Save to DB
-    conversation = await db["chats"].find_one({"conversation_id": request.conversation_id})
-    if not conversation:
-        conversation = {"conversation_id": request.conversation_id, "history": []}
-
-    conversation["history"].append(patient_entry.dict())
-    conversation["history"].append(doctor_entry.dict())
-
-    await db["chats"].update_one(
-        {"conversation_id": request.conversation_id},
-        {"$set": {"history": conversation["history"]}},
-        upsert=True
+    # Step 3: Translate doctor response back to patient language
+    with span("translate_out"):
+        doctor_msg_patient_lang = await translate(doctor_msg_en, request.target_lang, request.source_lang)
+
+    # Step 4: Save the turn
+    await _save_turn(request, db, patient_msg_en, doctor_msg_en, doctor_msg_patient_lang)
+
+    # Clients that already hold the history pass history_after and get only the new turn
+    with span("db_read"):
+        history, after_cursor = await load_history_since(db, request.conversation_id, request.history_after)
+    # ChatResponse shape; history holds HistoryMessage objects, serialized with orjson
+    return {"conversation_id": request.conversation_id, "history": history, "after_cursor": after_cursor}
+
+
+def _split_sentences(buffer: str) -> tuple:
+    """
+    Split complete sentences off the front of the buffer.
+    Returns ([(sentence, separator), ...], remainder).
+    """
+    sentences, start = [], 0
+    for match in _sentence_end.finditer(buffer):
+        if match.group(1) is not None:
+            end, separator = match.start(1), match.group(1)
+        else:
+            end, separator = match.start(), match.group(0)
+        sentence = buffer[start:end].strip()
+        if sentence:
+            sentences.append((sentence, separator))
+        start = match.end()
+    return sentences, buffer[start:]
+
+
+async def stream_doctor_patient_chat(request: ChatRequest, db):
+    """
+    Streaming variant of doctor_patient_chat. Yields (event, data) pairs:
+    - ("patient", {...})      patient message translated for the model
+    - ("token", {"text"})     LLM tokens as they arrive (English)
+    - ("translation", {...})  each finished sentence translated into source_lang, in order
+    - ("done", {...})         the saved turn, once the stream completes
+    """
+    patient_msg_en, messages = await _prepare_turn(request, db)
+    yield "patient", {"text": request.message, "translated_text": patient_msg_en}
+
+    tokens, buffer = [], ""
+    pending = deque()   # (translation task, separator) in sentence order
+    translated = []
+    index = 0
+
+    def schedule(sentence: str, separator: str):
+        task = asyncio.create_task(translate(sentence, request.target_lang, request.source_lang))
+        pending.append((task, separator))
+
+    try:
+        async for token in get_llm_client().stream_chat(messages, temperature=0.6):
+            tokens.append(token)
+            yield "token", {"text": token}
+
+            buffer += token
+            sentences, buffer = _split_sentences(buffer)
+            for sentence, separator in sentences:
+                schedule(sentence, separator)
+
+            # Flush translations that are ready without waiting on later ones
+            while pending and pending[0][0].done():
+                task, separator = pending.popleft()
+                translated.append(task.result() + separator)
+                yield "translation", {"index": index, "text": task.result()}
+                index += 1
+
+        if buffer.strip():
+            schedule(buffer.strip(), "")
+        while pending:
+            task, separator = pending.popleft()
+            text = await task
+            translated.append(text + separator)
+            yield "translation", {"index": index, "text": text}
+            index += 1
+    finally:
+        for task, _ in pending:
+            task.cancel()
+
+    doctor_msg_en = "".join(tokens)
+    doctor_msg_patient_lang = "".join(translated).strip()
+    patient_entry, doctor_entry = await _save_turn(
+        request, db, patient_msg_en, doctor_msg_en, doctor_msg_patient_lang
     )
-
-    return ChatResponse(conversation_id=request.conversation_id, history=conversation["history"])
+    yield "done", {
+        "conversation_id": request.conversation_id,
+        "messages": [
+            {"role": entry["sender_role"], "text": entry["text"], "translated_text": entry["translated_text"]}
+            for entry in (patient_entry, doctor_entry)
+        ],
+    }
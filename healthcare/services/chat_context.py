@@ -0,0 +1,168 @@
+# services/chat_context.py
+import asyncio
+import logging
+from config import (
+    CHAT_CONTEXT_TURNS,
+    CHAT_CONTEXT_TOKEN_BUDGET,
+    CHAT_SUMMARY_FOLD_TURNS,
+    CHAT_SUMMARY_MAX_WORDS,
+    CHAT_SUMMARY_FOLD_MAX_MESSAGES,
+    CHAT_SUMMARY_FOLD_TOKEN_BUDGET,
+)
+from services.chat_history import (
+    MESSAGES,
+    CHATS,
+    HISTORY_SORT,
+    HISTORY_SORT_DESC,
+    encode_cursor,
+    keyset_filter,
+)
+from services.llm_client import get_llm_client
+
+logger = logging.getLogger("chat_context")
+
+CONTEXT_PROJECTION = {"sender_role": 1, "text": 1, "translated_text": 1, "created_at": 1}
+ROLE_MAP = {"patient": "user", "doctor": "assistant"}
+
+# Background summary tasks (kept referenced until they finish)
+_background = set()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token plus per-message overhead; cheap and conservative enough
+    return len(text) // 4 + 4
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    return text[:max(0, (max_tokens - 4) * 4)]
+
+
+def _english(doc: dict) -> str:
+    # Both roles store the English version in translated_text
+    return doc.get("translated_text") or doc.get("text") or ""
+
+
+def _unsummarized_filter(conversation_id: str, summary_cursor: str) -> dict:
+    if summary_cursor:
+        return keyset_filter(conversation_id, summary_cursor, "$gt")
+    return {"conversation_id": conversation_id}
+
+
+async def build_context(db, conversation_id: str, system_prompt: str, user_message: str) -> list:
+    """
+    LLM messages for the next turn: system prompt (+ rolling summary of older
+    turns), the last CHAT_CONTEXT_TURNS turns verbatim, then the new message.
+    Reads are bounded and the result fits CHAT_CONTEXT_TOKEN_BUDGET, so cost
+    per turn stays flat however long the conversation gets.
+    """
+    chat = await db[CHATS].find_one({"conversation_id": conversation_id}, {"summary": 1, "summary_cursor": 1}) or {}
+    summary = chat.get("summary") or ""
+    system_prompt = system_prompt.strip()
+
+    limit = CHAT_CONTEXT_TURNS * 2
+    recent = await db[MESSAGES].find(
+        _unsummarized_filter(conversation_id, chat.get("summary_cursor")), CONTEXT_PROJECTION
+    ).sort(HISTORY_SORT_DESC).limit(limit).to_list(limit)
+    recent.reverse()
+
+    budget = CHAT_CONTEXT_TOKEN_BUDGET
+    user_message = _truncate(user_message, budget // 2)
+    budget -= estimate_tokens(user_message) + estimate_tokens(system_prompt)
+    if summary:
+        summary = _truncate(summary, max(0, budget) // 2)
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{summary}"
+        budget -= estimate_tokens(summary)
+
+    # Keep the newest turns that fit; drop the oldest first
+    history = []
+    for doc in reversed(recent):
+        content = _english(doc)
+        cost = estimate_tokens(content)
+        if cost > budget:
+            break
+        budget -= cost
+        history.append({"role": ROLE_MAP.get(doc["sender_role"], "user"), "content": content})
+    history.reverse()
+
+    return [{"role": "system", "content": system_prompt}, *history, {"role": "user", "content": user_message}]
+
+
+async def fold_summary(db, conversation_id: str):
+    """
+    Fold turns older than the verbatim window into the stored summary.
+    Runs only once CHAT_SUMMARY_FOLD_TURNS extra turns have piled up, so the
+    summarisation call is amortised over several turns. Each call folds at
+    most CHAT_SUMMARY_FOLD_MAX_MESSAGES oldest messages within
+    CHAT_SUMMARY_FOLD_TOKEN_BUDGET, so the prompt size is capped however
+    large the backlog is; the rest is folded on later turns.
+    """
+    chat = await db[CHATS].find_one({"conversation_id": conversation_id}, {"summary": 1, "summary_cursor": 1}) or {}
+    keep = CHAT_CONTEXT_TURNS * 2
+    threshold = keep + CHAT_SUMMARY_FOLD_TURNS * 2
+    query = _unsummarized_filter(conversation_id, chat.get("summary_cursor"))
+
+    pending = await db[MESSAGES].count_documents(query, limit=threshold)
+    if pending < threshold:
+        return
+
+    # Everything except the newest `keep` unsummarised messages
+    newest = await db[MESSAGES].find(query, {"created_at": 1}).sort(HISTORY_SORT_DESC).skip(keep).limit(1).to_list(1)
+    if not newest:
+        return
+    fold_query = {"$and": [query, keyset_filter(conversation_id, encode_cursor(newest[0]), "$lte")]}
+    docs = await db[MESSAGES].find(fold_query, CONTEXT_PROJECTION).sort(HISTORY_SORT).limit(
+        CHAT_SUMMARY_FOLD_MAX_MESSAGES).to_list(CHAT_SUMMARY_FOLD_MAX_MESSAGES)
+
+    # Oldest first, while they fit the budget (a single oversized message is truncated)
+    budget = CHAT_SUMMARY_FOLD_TOKEN_BUDGET
+    lines, folded = [], None
+    for doc in docs:
+        content = _english(doc)
+        if folded is not None and estimate_tokens(content) > budget:
+            break
+        content = _truncate(content, budget)
+        budget -= estimate_tokens(content)
+        lines.append(f"{doc['sender_role'].title()}: {content}")
+        folded = doc
+    if folded is None:
+        return
+    new_cursor = encode_cursor(folded)
+    transcript = "\n".join(lines)
+    summary = await get_llm_client().chat(
+        [{
+            "role": "user",
+            "content": f"""
+Update the running summary of a rural telemedicine doctor–patient conversation.
+Keep symptoms and their duration, relevant history, medicines, allergies, advice
+given and open follow-up questions. At most {CHAT_SUMMARY_MAX_WORDS} words.
+
+Current summary:
+{chat.get("summary") or "(none)"}
+
+New messages:
+{transcript}
+""",
+        }],
+        temperature=0.2,
+    )
+
+    # Only apply if no other fold moved the cursor meanwhile
+    await db[CHATS].update_one(
+        {"conversation_id": conversation_id, "summary_cursor": chat.get("summary_cursor")},
+        {"$set": {"summary": summary.strip(), "summary_cursor": new_cursor}},
+    )
+
+
+def schedule_fold(db, conversation_id: str):
+    """
+    Update the summary in the background so the turn is not delayed by it.
+    """
+    async def run():
+        try:
+            await fold_summary(db, conversation_id)
+        except Exception:
+            logger.exception("Summary update failed for conversation %s", conversation_id)
+
+    task = asyncio.create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
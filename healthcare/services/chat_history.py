@@ -0,0 +1,179 @@
+# services/chat_history.py
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+# One document per message (models.message_model); "chats" only keeps
+# per-conversation metadata, so a turn never rewrites the whole history.
+MESSAGES = "messages"
+CHATS = "chats"
+
+HISTORY_PROJECTION = {"sender_role": 1, "text": 1, "translated_text": 1, "created_at": 1}
+HISTORY_SORT = [("created_at", ASCENDING), ("_id", ASCENDING)]
+HISTORY_SORT_DESC = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 200
+
+EPOCH = datetime(1970, 1, 1)
+
+
+async def migrate_legacy_histories(db):
+    """
+    Move conversations saved before the per-message layout (an embedded
+    chats.history array) into the messages collection. Upserts keyed on
+    legacy_index make this idempotent; legacy messages sort before all others.
+    """
+    async for chat in db[CHATS].find({"history": {"$exists": True}}, {"conversation_id": 1, "history": 1}):
+        conversation_id = chat["conversation_id"]
+        ops = [
+            UpdateOne(
+                {"conversation_id": conversation_id, "legacy_index": i},
+                {"$setOnInsert": {
+                    "conversation_id": conversation_id,
+                    "sender_role": entry.get("role"),
+                    "text": entry.get("text"),
+                    "translated_text": entry.get("translated_text"),
+                    "language": "auto",
+                    "created_at": EPOCH + timedelta(milliseconds=i),
+                }},
+                upsert=True,
+            )
+            for i, entry in enumerate(chat["history"])
+        ]
+        if ops:
+            await db[MESSAGES].bulk_write(ops, ordered=False)
+        await db[CHATS].update_one(
+            {"_id": chat["_id"]},
+            {"$unset": {"history": ""}, "$inc": {"message_count": len(ops)}},
+        )
+
+
+def encode_cursor(doc: dict) -> str:
+    """
+    Opaque keyset cursor for a message: "<created_at ms>_<ObjectId>".
+    """
+    ms = int((doc["created_at"] - EPOCH) / timedelta(milliseconds=1))
+    return f"{ms}_{doc['_id']}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        ms, oid = cursor.split("_", 1)
+        return EPOCH + timedelta(milliseconds=int(ms)), ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def keyset_filter(conversation_id: str, cursor: str, op: str) -> dict:
+    created_at, oid = decode_cursor(cursor)
+    return {
+        "conversation_id": conversation_id,
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: oid}},
+        ],
+    }
+
+
+@dataclass(slots=True)
+class HistoryMessage:
+    """
+    A history entry in the schemas.ChatMessage shape, kept compact (slotted,
+    no per-instance dict) and serialized by orjson as is, so long histories
+    skip per-message Pydantic validation.
+    """
+    id: str
+    role: str
+    text: str
+    translated_text: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+def to_chat_message(doc: dict) -> HistoryMessage:
+    """
+    Map a stored message document to a HistoryMessage.
+    """
+    return HistoryMessage(str(doc["_id"]), doc["sender_role"], doc["text"],
+                          doc.get("translated_text"), doc.get("created_at"))
+
+
+async def append_messages(db, conversation_id: str, messages: list):
+    """
+    Atomically append messages to a conversation: constant-cost inserts, so
+    concurrent turns on the same conversation cannot overwrite each other.
+    """
+    now = datetime.utcnow()
+    await db[MESSAGES].insert_many(messages, ordered=True)
+    await db[CHATS].update_one(
+        {"conversation_id": conversation_id},
+        {
+            "$setOnInsert": {"conversation_id": conversation_id, "created_at": now},
+            "$set": {"updated_at": now},
+            "$inc": {"message_count": len(messages)},
+        },
+        upsert=True,
+    )
+
+
+async def load_history_since(db, conversation_id: str, after: str = None) -> tuple:
+    """
+    The full history, or only the messages newer than the `after` cursor,
+    oldest first. Returns (messages, cursor to pass as `after` next time).
+    """
+    query = keyset_filter(conversation_id, after, "$gt") if after else {"conversation_id": conversation_id}
+    history, last = [], None
+    async for doc in db[MESSAGES].find(query, HISTORY_PROJECTION).sort(HISTORY_SORT):
+        history.append(to_chat_message(doc))
+        last = doc
+    return history, encode_cursor(last) if last else after
+
+
+async def load_history_page(db, conversation_id: str, before: str = None, after: str = None,
+                            limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    One page of history, oldest first, using keyset pagination on (created_at, _id).
+    - no cursor: the latest `limit` messages
+    - before:    the `limit` messages immediately older than the cursor
+    - after:     the `limit` messages immediately newer than the cursor
+    Cost depends on `limit`, not on the conversation length.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if after:
+        query, sort = keyset_filter(conversation_id, after, "$gt"), HISTORY_SORT
+    elif before:
+        query, sort = keyset_filter(conversation_id, before, "$lt"), HISTORY_SORT_DESC
+    else:
+        query, sort = {"conversation_id": conversation_id}, HISTORY_SORT_DESC
+
+    # Fetch one extra document to learn whether another page exists
+    docs = await db[MESSAGES].find(query, HISTORY_PROJECTION).sort(sort).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if not after:
+        docs.reverse()
+
+    return {
+        "conversation_id": conversation_id,
+        "history": [to_chat_message(doc) for doc in docs],
+        # More messages exist in the paging direction (older, or newer with `after`)
+        "has_more": has_more,
+        # Pass as `before` for older messages / as `after` to poll for newer ones
+        "before_cursor": encode_cursor(docs[0]) if docs else before,
+        "after_cursor": encode_cursor(docs[-1]) if docs else after,
+    }
+
+
+async def stream_history(db, conversation_id: str, after: str = None):
+    """
+    Yield messages oldest first straight from the Mongo cursor, so the full
+    history is never materialised in memory.
+    """
+    query = keyset_filter(conversation_id, after, "$gt") if after else {"conversation_id": conversation_id}
+    cursor = db[MESSAGES].find(query, HISTORY_PROJECTION).sort(HISTORY_SORT).batch_size(STREAM_BATCH_SIZE)
+    async for doc in cursor:
+        yield to_chat_message(doc)
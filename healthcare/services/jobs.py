@@ -0,0 +1,384 @@
+# services/jobs.py
+# Persistent job queue for long-running requests: clients submit a job, get
+# its id back at once, and poll for the result or receive it by webhook.
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+import httpx
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from config import (
+    JOB_POLL_INTERVAL_SEC,
+    JOB_LEASE_SEC,
+    JOB_MAX_ATTEMPTS,
+    JOB_CONCURRENCY,
+    JOB_WEBHOOK_TIMEOUT,
+    JOB_WEBHOOK_RETRIES,
+    JOB_CALLBACK_ALLOWED_HOSTS,
+)
+from schemas import SymptomCheckRequest
+from services.stt_translate import speech_to_text_and_translate, SpeechToTextDisabled, TranscriptionQueueFull
+from services.symptom_checker import analyze_symptoms
+
+logger = logging.getLogger("jobs")
+
+JOBS = "jobs"
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# Highest priority first, then oldest first
+CLAIM_SORT = [("priority", -1), ("created_at", 1)]
+QUEUE_FULL_DELAY_SEC = 5
+# Fields returned to clients (never the stored audio)
+STATUS_PROJECTION = {"payload": 0, "lease_until": 0, "worker": 0}
+
+
+class InvalidCallbackURL(ValueError):
+    """Raised for a callback_url the server must not call (maps to HTTP 400)."""
+
+
+async def check_callback_url(url: str, allowed_hosts: set = JOB_CALLBACK_ALLOWED_HOSTS):
+    """
+    Reject callback URLs that would make the server call into its own
+    network: only http(s), and either an allowlisted host or one whose
+    every address is public (no loopback, private, link-local, reserved or
+    multicast). Checked at submit and again before each delivery; redirects
+    are not followed.
+
+    Returns the checked address to connect to (None for allowlisted hosts),
+    so delivery does not resolve the name a second time (DNS rebinding).
+    """
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError as e:
+        raise InvalidCallbackURL(f"Invalid callback_url: {e}")
+    if parts.scheme not in ("http", "https") or not host:
+        raise InvalidCallbackURL("callback_url must be an http(s) URL")
+    if allowed_hosts:
+        if host.lower() not in allowed_hosts:
+            raise InvalidCallbackURL(f"callback_url host {host!r} is not allowed")
+        return None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror:
+        raise InvalidCallbackURL(f"callback_url host {host!r} does not resolve")
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    for address in addresses:
+        if not address.is_global or address.is_multicast:
+            raise InvalidCallbackURL(f"callback_url host {host!r} resolves to a non-public address")
+    return addresses[0]
+
+
+def pinned_request(url: str, address) -> tuple:
+    """
+    (url, headers, extensions) for an httpx request that connects to
+    `address` but still speaks to the URL's host: Host header and TLS
+    SNI/certificate check use the original name.
+    """
+    if address is None:
+        return url, {}, {}
+    parts = urlsplit(url)
+    userinfo, _, hostport = parts.netloc.rpartition("@")
+    ip = f"[{address}]" if address.version == 6 else str(address)
+    netloc = (f"{userinfo}@" if userinfo else "") + ip + (f":{parts.port}" if parts.port else "")
+    return urlunsplit(parts._replace(netloc=netloc)), {"Host": hostport}, {"sni_hostname": parts.hostname}
+
+
+class BytesUpload:
+    """
+    In-memory stand-in for an UploadFile (what speech_to_text_and_translate reads).
+    """
+
+    def __init__(self, data: bytes):
+        self._data = memoryview(data)
+        self._pos = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else self._pos + size
+        chunk = bytes(self._data[self._pos:end])
+        self._pos += len(chunk)
+        return chunk
+
+
+async def _run_stt(job: dict, db) -> dict:
+    payload = job["payload"]
+    return await speech_to_text_and_translate(
+        BytesUpload(payload["audio"]), db, payload["target_lang"], payload.get("model")
+    )
+
+
+async def _run_symptom_check(job: dict, db) -> dict:
+    result = await analyze_symptoms(SymptomCheckRequest(**job["payload"]), db)
+    await db["symptom_checks"].insert_one({**result.dict(), "created_at": datetime.utcnow()})
+    return result.dict()
+
+
+# Job type -> handler(job, db) returning the result document
+HANDLERS = {
+    "stt": _run_stt,
+    "symptom_check": _run_symptom_check,
+}
+
+# Errors that another attempt cannot fix (bad input: undecodable or oversized
+# audio, unknown target_lang/model, invalid payload; STT switched off): the job
+# fails at once instead of retrying with backoff
+PERMANENT_ERRORS = (ValueError, SpeechToTextDisabled)
+
+
+def job_status(job: dict) -> dict:
+    """
+    Stored job -> JobStatusResponse shape.
+    """
+    return {
+        "job_id": str(job["_id"]),
+        "type": job["type"],
+        "status": job["status"],
+        "priority": job.get("priority", 0),
+        "attempts": job.get("attempts", 0),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
+
+
+async def submit_job(db, job_type: str, payload: dict, priority: int = 0, callback_url: str = None) -> dict:
+    """
+    Queue a job and return its status right away.
+    Raises InvalidCallbackURL for a callback_url that fails check_callback_url.
+    """
+    if callback_url:
+        await check_callback_url(callback_url)
+    now = datetime.utcnow()
+    job = {
+        "type": job_type,
+        "status": QUEUED,
+        "priority": priority,
+        "payload": payload,
+        "callback_url": callback_url,
+        "attempts": 0,
+        "available_at": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db[JOBS].insert_one(job)
+    if job_worker is not None:
+        job_worker.notify()
+    return job_status(job)
+
+
+async def get_job(db, job_id: str):
+    try:
+        oid = ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+    job = await db[JOBS].find_one({"_id": oid}, STATUS_PROJECTION)
+    return job_status(job) if job else None
+
+
+class JobWorker:
+    """
+    Claims jobs from the queue and runs them, keeping at most
+    JOB_CONCURRENCY[type] jobs of each type running in this process.
+    A claim is an atomic find_one_and_update that takes a lease; running
+    jobs renew it, and jobs whose lease ran out (crashed worker) are
+    claimed again, up to JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, db, concurrency: dict = JOB_CONCURRENCY, lease_sec: float = JOB_LEASE_SEC,
+                 poll_interval: float = JOB_POLL_INTERVAL_SEC, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db = db
+        self.concurrency = {t: concurrency.get(t, 1) for t in HANDLERS}
+        self.lease = timedelta(seconds=lease_sec)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = {t: set() for t in HANDLERS}
+        self._wake = asyncio.Event()
+        self._loop_task = None
+        self._stopping = False
+        self._http = None
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        self._http = httpx.AsyncClient(timeout=JOB_WEBHOOK_TIMEOUT)
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop claiming, cancel running jobs and hand them back to the queue.
+        """
+        self._stopping = True
+        tasks = [task for running in self._running.values() for task in running]
+        if self._loop_task:
+            tasks.append(self._loop_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.db[JOBS].update_many(
+                {"status": RUNNING, "worker": self.worker_id},
+                {"$set": {"status": QUEUED, "updated_at": datetime.utcnow()},
+                 "$inc": {"attempts": -1}, "$unset": {"lease_until": "", "worker": ""}},
+            )
+        except PyMongoError as e:
+            logger.warning("Could not release running jobs (leases will expire): %s", e)
+        if self._http:
+            await self._http.aclose()
+
+    def _free_types(self) -> list:
+        return [t for t, running in self._running.items() if len(running) < self.concurrency[t]]
+
+    async def _claim(self, types: list):
+        now = datetime.utcnow()
+        return await self.db[JOBS].find_one_and_update(
+            {
+                "type": {"$in": types},
+                "$or": [
+                    {"status": QUEUED, "available_at": {"$lte": now}},
+                    {"status": RUNNING, "lease_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {"status": RUNNING, "worker": self.worker_id,
+                         "lease_until": now + self.lease, "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=CLAIM_SORT,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self):
+        # The flag backs up cancel(): a wake-up racing the cancellation can
+        # make wait_for swallow it (Python < 3.12)
+        while not self._stopping:
+            # Cleared before claiming, so a submit during the claim is not missed
+            self._wake.clear()
+            try:
+                types = self._free_types()
+                job = await self._claim(types) if types else None
+            except PyMongoError as e:
+                logger.warning("Job claim failed: %s", e)
+                job = None
+            if job is not None:
+                task = asyncio.create_task(self._execute(job))
+                running = self._running[job["type"]]
+                running.add(task)
+                task.add_done_callback(lambda t, running=running: (running.discard(t), self.notify()))
+                continue
+            # Nothing claimable: wait for a submit, a finished job, or the next poll
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            await self.db[JOBS].update_one(
+                {"_id": job_id, "worker": self.worker_id},
+                {"$set": {"lease_until": datetime.utcnow() + self.lease}},
+            )
+
+    async def _finish(self, job: dict, update: dict):
+        update["$set"]["updated_at"] = datetime.utcnow()
+        update.setdefault("$unset", {}).update({"lease_until": "", "worker": ""})
+        await self.db[JOBS].update_one({"_id": job["_id"], "worker": self.worker_id}, update)
+
+    async def _execute(self, job: dict):
+        if job["attempts"] > self.max_attempts:
+            await self._finish(job, {"$set": {"status": FAILED, "error": "Too many attempts",
+                                              "finished_at": datetime.utcnow()}})
+            await self._deliver(job["_id"])
+            return
+
+        renew = asyncio.create_task(self._renew_lease(job["_id"]))
+        try:
+            result = await HANDLERS[job["type"]](job, self.db)
+        except TranscriptionQueueFull:
+            # Capacity, not a failure: requeue without using up an attempt
+            await self._finish(job, {
+                "$set": {"status": QUEUED,
+                         "available_at": datetime.utcnow() + timedelta(seconds=QUEUE_FULL_DELAY_SEC)},
+                "$inc": {"attempts": -1},
+            })
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Job %s (%s) failed on attempt %d: %s", job["_id"], job["type"], job["attempts"], e)
+            if job["attempts"] < self.max_attempts and not isinstance(e, PERMANENT_ERRORS):
+                backoff = min(60, 2 ** job["attempts"]) * random.uniform(0.5, 1.0)
+                await self._finish(job, {"$set": {
+                    "status": QUEUED, "error": str(e),
+                    "available_at": datetime.utcnow() + timedelta(seconds=backoff),
+                }})
+                return
+            await self._finish(job, {"$set": {"status": FAILED, "error": str(e),
+                                              "finished_at": datetime.utcnow()}})
+            await self._deliver(job["_id"])
+            return
+        finally:
+            renew.cancel()
+
+        # Done: keep the result, drop the (possibly large) input audio
+        await self._finish(job, {
+            "$set": {"status": DONE, "result": result, "error": None, "finished_at": datetime.utcnow()},
+            "$unset": {"payload.audio": ""},
+        })
+        await self._deliver(job["_id"])
+
+    async def _deliver(self, job_id):
+        """
+        POST the final job status to its callback_url, with retries.
+        """
+        job = await self.db[JOBS].find_one({"_id": job_id}, STATUS_PROJECTION)
+        if not job or not job.get("callback_url"):
+            return
+        body = job_status(job)
+        body["created_at"] = body["created_at"] and body["created_at"].isoformat()
+        body["updated_at"] = body["updated_at"] and body["updated_at"].isoformat()
+        try:
+            address = await check_callback_url(job["callback_url"])
+        except InvalidCallbackURL as e:
+            logger.warning("Not delivering webhook for job %s: %s", job_id, e)
+            return
+        url, headers, extensions = pinned_request(job["callback_url"], address)
+        for attempt in range(JOB_WEBHOOK_RETRIES):
+            try:
+                resp = await self._http.post(url, json=body, headers=headers, extensions=extensions)
+                if resp.status_code < 400:
+                    await self.db[JOBS].update_one({"_id": job_id}, {"$set": {"webhook_delivered": True}})
+                    return
+            except httpx.HTTPError as e:
+                logger.info("Webhook for job %s failed: %r", job_id, e)
+            await asyncio.sleep(2 ** attempt)
+        logger.warning("Giving up on webhook for job %s", job_id)
+
+
+# Global job worker (started at app startup)
+job_worker = None
+
+def start_job_worker(db, concurrency: dict = JOB_CONCURRENCY):
+    global job_worker
+    if job_worker is None:
+        job_worker = JobWorker(db, concurrency)
+        job_worker.start()
+        limits = ", ".join(f"{t}={n}" for t, n in job_worker.concurrency.items())
+        print(f"✅ Job worker started ({limits}).")
+
+async def stop_job_worker():
+    global job_worker
+    if job_worker is not None:
+        await job_worker.stop()
+        job_worker = None
@@ -0,0 +1,203 @@
+# services/llm_client.py
+import asyncio
+import json
+import random
+import httpx
+from config import (
+    GROQ_API_KEY,
+    GROQ_MODEL,
+    GROQ_BASE_URL,
+    LLM_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+)
+
+# Rate limiting and transient server errors are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Marks the end of a stream_chat queue
+_STREAM_END = object()
+
+
+class LLMClient:
+    """
+    Async client for an OpenAI-compatible chat completions endpoint (Groq by default).
+    Keeps a pooled keep-alive connection set, caps in-flight requests and retries
+    429/5xx responses with exponential backoff.
+    """
+
+    def __init__(self, base_url: str = GROQ_BASE_URL, api_key: str = GROQ_API_KEY,
+                 model: str = GROQ_MODEL, max_connections: int = LLM_MAX_CONNECTIONS,
+                 max_keepalive: int = LLM_MAX_KEEPALIVE, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT, connect_timeout: float = LLM_CONNECT_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._limits = httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive)
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self._limits,
+                timeout=self._timeout,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = self.backoff_base * (2 ** attempt)
+        return min(delay, self.backoff_max) * random.uniform(0.5, 1.0)
+
+    async def post(self, payload: dict) -> dict:
+        """
+        POST a completion payload and return the decoded JSON body.
+        Raises RuntimeError once retries are exhausted or on a non-retryable error.
+        """
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with self._semaphore:
+                    resp = await self.client.post(self.base_url, json=payload)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise RuntimeError(f"Groq API error: {e!r}") from e
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if resp.status_code == 200:
+                return resp.json()
+            if resp.status_code in RETRY_STATUS_CODES and not last_attempt:
+                await asyncio.sleep(self._backoff(attempt, resp.headers.get("Retry-After")))
+                continue
+            raise RuntimeError(f"Groq API error: {resp.text}")
+
+    async def chat(self, messages: list, temperature: float = 0.6, **params) -> str:
+        """
+        Run a chat completion and return the assistant message content.
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            **params,
+        }
+        body = await self.post(data)
+        return body["choices"][0]["message"]["content"]
+
+    async def stream_chat(self, messages: list, temperature: float = 0.6, **params):
+        """
+        Run a streaming chat completion, yielding content deltas as they arrive.
+        Upstream is read into a queue by a background task, so the concurrency
+        slot is held only while the LLM is sending, not while a slow client
+        (e.g. a websocket) drains the deltas.
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+            **params,
+        }
+        queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(data, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            reader.cancel()
+
+    async def _read_stream(self, data: dict, queue: asyncio.Queue):
+        """
+        Producer for stream_chat: puts content deltas on `queue`, then
+        _STREAM_END or the exception that ended the stream.
+        Retries (429/5xx, connection errors) only happen before the first token.
+        """
+        started = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                retry_delay = None
+                try:
+                    async with self._semaphore:
+                        async with self.client.stream("POST", self.base_url, json=data) as resp:
+                            if resp.status_code != 200:
+                                body = (await resp.aread()).decode("utf-8", "replace")
+                                if resp.status_code in RETRY_STATUS_CODES and not last_attempt:
+                                    retry_delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+                                else:
+                                    raise RuntimeError(f"Groq API error: {body}")
+                            else:
+                                # Server-sent events: "data: {json}" lines, ending with "data: [DONE]"
+                                async for line in resp.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue
+                                    payload = line[len("data:"):].strip()
+                                    if payload == "[DONE]":
+                                        break
+                                    delta = json.loads(payload)["choices"][0].get("delta", {})
+                                    if delta.get("content"):
+                                        started = True
+                                        queue.put_nowait(delta["content"])
+                                queue.put_nowait(_STREAM_END)
+                                return
+                except httpx.TransportError as e:
+                    # Once tokens went out, a retry would repeat them
+                    if last_attempt or started:
+                        raise RuntimeError(f"Groq API error: {e!r}") from e
+                    retry_delay = self._backoff(attempt)
+                await asyncio.sleep(retry_delay)
+        except Exception as e:
+            queue.put_nowait(e)
+
+
+# Shared client (one connection pool per process)
+llm_client = None
+
+def get_llm_client() -> LLMClient:
+    global llm_client
+    if llm_client is None:
+        llm_client = LLMClient()
+    return llm_client
+
+async def close_llm_client():
+    """
+    Close the shared client's connection pool during FastAPI shutdown.
+    """
+    global llm_client
+    if llm_client is not None:
+        await llm_client.aclose()
+        llm_client = None
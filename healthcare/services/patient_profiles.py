@@ -1,11 +1,31 @@
+import csv
+import orjson
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 from schemas import PatientProfileCreate, PatientProfileResponse
 from datetime import datetime
 from bson import ObjectId
+from services.profile_context import invalidate_profile
+
+BULK_CHUNK_SIZE = 1000
+MAX_BATCH_IDS = 1000
+MAX_REPORTED_ERRORS = 1000
+# CSV cells for list fields hold several values separated by ";"
+LIST_FIELDS = ("allergies", "chronic_conditions", "medications")
+DUPLICATE_KEY = 11000
+# Longest CSV record / NDJSON line accepted by the bulk import
+MAX_RECORD_BYTES = 64 * 1024
+
+
+class RecordTooLong(ValueError):
+    """A bulk import row longer than MAX_RECORD_BYTES (reported, then skipped)."""
+
 
 async def create_patient_profile(profile: PatientProfileCreate, db) -> PatientProfileResponse:
     doc = profile.dict()
     doc["created_at"] = datetime.utcnow()
     result = await db["patients"].insert_one(doc)
+    invalidate_profile(profile.patient_id)
     doc["_id"] = str(result.inserted_id)
     return PatientProfileResponse(**doc)
 
@@ -15,3 +35,152 @@ async def get_patient_profile(patient_id: str, db):
         profile["_id"] = str(profile["_id"])
         return PatientProfileResponse(**profile)
     return None
+
+async def get_patient_profiles(patient_ids: list, db) -> dict:
+    """
+    Fetch many profiles with a single $in query.
+    """
+    ids = list(dict.fromkeys(patient_ids))
+    profiles = []
+    async for profile in db["patients"].find({"patient_id": {"$in": ids}}):
+        profile["_id"] = str(profile["_id"])
+        profiles.append(PatientProfileResponse(**profile))
+    found = {p.patient_id for p in profiles}
+    return {"patients": profiles, "missing": [i for i in ids if i not in found]}
+
+
+# -------------------------------
+# Bulk import (CSV / NDJSON)
+# -------------------------------
+async def _iter_lines(chunks, quoted: bool = False):
+    """
+    Split an async stream of byte chunks into raw records, numbered by the
+    line they start on. With `quoted`, a newline inside a double-quoted CSV
+    field does not end the record. Records longer than MAX_RECORD_BYTES are
+    yielded as a RecordTooLong error and skipped, so at most one record is
+    ever buffered.
+    """
+    pending = bytearray()
+    scanned = 0
+    line_no = 0
+    first = 1
+    in_quotes = False
+    oversized = False
+    async for chunk in chunks:
+        pending += chunk
+        while (nl := pending.find(b"\n", scanned)) >= 0:
+            if quoted:
+                in_quotes ^= pending.count(b'"', scanned, nl) % 2 == 1
+            line_no += 1
+            scanned = nl + 1
+            if in_quotes:
+                continue
+            record = bytes(pending[:nl])
+            del pending[:scanned]
+            scanned = 0
+            if oversized:
+                oversized = False
+            elif len(record) > MAX_RECORD_BYTES:
+                yield first, RecordTooLong(f"row exceeds {MAX_RECORD_BYTES} bytes")
+            else:
+                yield first, record
+            first = line_no + 1
+        if quoted:
+            in_quotes ^= pending.count(b'"', scanned) % 2 == 1
+        scanned = len(pending)
+        if len(pending) > MAX_RECORD_BYTES:
+            # Drop the rest of this record as it arrives
+            if not oversized:
+                yield first, RecordTooLong(f"row exceeds {MAX_RECORD_BYTES} bytes")
+                oversized = True
+            pending.clear()
+            scanned = 0
+    if pending and not oversized:
+        yield first, bytes(pending)
+
+async def _iter_records(chunks, fmt: str):
+    """
+    Yield (line number, raw dict or exception) for each non-empty record.
+    CSV input needs a header row; invalid UTF-8 is reported for its row.
+    """
+    header = None
+    async for line_no, raw in _iter_lines(chunks, quoted=fmt == "csv"):
+        if isinstance(raw, Exception):
+            yield line_no, raw
+            continue
+        try:
+            line = raw.decode("utf-8-sig").rstrip("\r")
+            if not line.strip():
+                continue
+            if fmt == "csv":
+                cells = next(csv.reader([line]))
+                if header is None:
+                    header = [c.strip() for c in cells]
+                    continue
+                record = {k: v.strip() for k, v in zip(header, cells) if v.strip()}
+                for field in LIST_FIELDS:
+                    if field in record:
+                        record[field] = [v.strip() for v in record[field].split(";") if v.strip()]
+            else:
+                record = orjson.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("each line must be a JSON object")
+            yield line_no, record
+        except (ValueError, csv.Error) as e:
+            yield line_no, e
+
+async def _insert_chunk(batch: list, db, report: dict):
+    """
+    Unordered insert_many: good rows are written even if others in the chunk fail.
+    """
+    try:
+        result = await db["patients"].insert_many([doc for _, doc in batch], ordered=False)
+        inserted = len(result.inserted_ids)
+        failed_indexes = set()
+    except BulkWriteError as e:
+        inserted = e.details.get("nInserted", 0)
+        failed_indexes = set()
+        for err in e.details.get("writeErrors", []):
+            line_no, doc = batch[err["index"]]
+            failed_indexes.add(err["index"])
+            message = (f"duplicate patient_id '{doc['patient_id']}'"
+                       if err.get("code") == DUPLICATE_KEY else err.get("errmsg", "write error"))
+            _report_error(report, line_no, message)
+    report["inserted"] += inserted
+    for i, (_, doc) in enumerate(batch):
+        if i not in failed_indexes:
+            invalidate_profile(doc["patient_id"])
+
+def _report_error(report: dict, line_no: int, message: str):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": line_no, "error": message})
+
+async def bulk_import_patients(chunks, fmt: str, db) -> dict:
+    """
+    Stream-import patient profiles. Each row is validated with
+    PatientProfileCreate and rows are written in unordered chunks of
+    BULK_CHUNK_SIZE. Returns counts plus per-row errors (by line number).
+    """
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    batch = []
+    now = datetime.utcnow()
+    async for line_no, record in _iter_records(chunks, fmt):
+        if isinstance(record, Exception):
+            _report_error(report, line_no, f"unparseable row: {record}")
+            continue
+        try:
+            profile = PatientProfileCreate(**record)
+        except ValidationError as e:
+            problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            _report_error(report, line_no, problems)
+            continue
+        doc = profile.dict()
+        doc["created_at"] = now
+        batch.append((line_no, doc))
+        if len(batch) >= BULK_CHUNK_SIZE:
+            await _insert_chunk(batch, db, report)
+            batch = []
+    if batch:
+        await _insert_chunk(batch, db, report)
+    return report
@@ -0,0 +1,47 @@
+# services/profile_context.py
+from typing import NamedTuple, Optional
+from cache import LRUCache
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, PROFILE_CACHE_MISS_TTL
+
+
+class ProfileContext(NamedTuple):
+    profile: Optional[dict]
+    prompt: str  # rendered "Patient Profile" fragment ("" if no profile)
+
+
+# patient_id -> ProfileContext (unknown patients are cached briefly as well)
+_cache = LRUCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+
+def render_profile_context(profile: dict) -> str:
+    """
+    Format a patient profile as the prompt fragment shared by chat and symptom checks.
+    """
+    allergies = ", ".join(profile.get("allergies") or [])
+    chronic = ", ".join(profile.get("chronic_conditions") or [])
+    meds = ", ".join(profile.get("medications") or [])
+    return f"\n\nPatient Profile:\n- Age: {profile.get('age')}\n- Sex: {profile.get('sex')}\n- Allergies: {allergies}\n- Chronic Conditions: {chronic}\n- Current Medications: {meds}"
+
+
+async def get_profile_context(db, patient_id: str) -> ProfileContext:
+    """
+    Cached profile lookup: returning patients cost no Mongo round-trip
+    and no prompt formatting.
+    """
+    context = _cache.get(patient_id)
+    if context is None:
+        profile = await db["patients"].find_one({"patient_id": patient_id})
+        if profile:
+            context = ProfileContext(profile, render_profile_context(profile))
+            _cache.set(patient_id, context)
+        else:
+            context = ProfileContext(None, "")
+            _cache.set(patient_id, context, ttl=PROFILE_CACHE_MISS_TTL)
+    return context
+
+
+def invalidate_profile(patient_id: str):
+    """
+    Drop a cached profile; call after any write to that patient.
+    """
+    _cache.pop(patient_id)
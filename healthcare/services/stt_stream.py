@@ -0,0 +1,157 @@
+# services/stt_stream.py
+import asyncio
+import numpy as np
+from config import STT_STREAM_WINDOW_SEC, STT_STREAM_OVERLAP_SEC
+from services import stt_translate
+from services.audio import has_speech
+from services.stt_translate import TranscriptionQueueFull
+from services.translation import translate
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2          # ffmpeg emits 16-bit PCM
+PCM_READ_BYTES = 64 * 1024
+QUEUE_FULL_RETRY_SEC = 1.0
+QUEUE_FULL_MAX_RETRIES = 30
+
+
+async def decode_pcm_stream(chunks):
+    """
+    Decode an async stream of encoded audio bytes (any format ffmpeg knows)
+    into 16 kHz mono s16le PCM, yielding raw PCM bytes as they are produced.
+    Nothing touches the disk, and pipe backpressure keeps memory bounded.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            proc.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while data := await proc.stdout.read(PCM_READ_BYTES):
+            yield data
+        await feeder
+    finally:
+        feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+
+async def _transcribe_with_retry(audio: np.ndarray, model: str = None) -> dict:
+    # A long recording should wait for capacity rather than fail mid-stream
+    pool = await stt_translate.get_transcription_pool()
+    for _ in range(QUEUE_FULL_MAX_RETRIES):
+        try:
+            return await pool.transcribe(audio, model)
+        except TranscriptionQueueFull:
+            await asyncio.sleep(QUEUE_FULL_RETRY_SEC)
+    return await pool.transcribe(audio, model)
+
+
+async def _transcribe_window(pcm: bytes, offset: float, first: bool, last: bool, model: str = None) -> tuple:
+    """
+    Transcribe one window and keep only the segments it "owns": overlapping
+    windows split the shared region at its midpoint, by segment start time.
+    """
+    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    duration = len(audio) / SAMPLE_RATE
+    margin = STT_STREAM_OVERLAP_SEC / 2
+
+    # Silent stretches of long field recordings never reach Whisper
+    if not await asyncio.to_thread(has_speech, audio):
+        return "", offset, offset + duration, None
+
+    result = await _transcribe_with_retry(audio, model)
+    segments = [
+        seg for seg in result["segments"]
+        if (first or seg["start"] >= margin) and (last or seg["start"] < duration - margin)
+    ]
+    text = " ".join(seg["text"].strip() for seg in segments).strip()
+    start = offset + (segments[0]["start"] if segments else 0.0)
+    end = offset + (segments[-1]["end"] if segments else duration)
+    return text, start, end, result["whisper"]["model"]
+
+
+async def stream_transcribe(chunks, target_lang: str = "en", model: str = None):
+    """
+    Transcribe and translate an audio stream incrementally.
+    Yields {"type": "partial", ...} events per window, then one {"type": "final", ...}.
+    Only the current window of PCM is held in memory.
+    """
+    window_bytes = int(STT_STREAM_WINDOW_SEC * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    overlap_bytes = int(STT_STREAM_OVERLAP_SEC * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    step_bytes = window_bytes - overlap_bytes
+
+    buf = bytearray()
+    offset = 0.0
+    index = 0
+    originals, translations = [], []
+    tiers = set()
+
+    async def emit(pcm: bytes, last: bool) -> dict:
+        text, start, end, tier = await _transcribe_window(pcm, offset, index == 0, last, model)
+        if tier:
+            tiers.add(tier)
+        translated = (await translate(text, "auto", target_lang)).strip()
+        if text:
+            originals.append(text)
+            translations.append(translated)
+        return {
+            "type": "partial",
+            "index": index,
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "original_text": text,
+            "translated_text": translated,
+            "model": tier,
+        }
+
+    async for pcm in decode_pcm_stream(chunks):
+        buf += pcm
+        while len(buf) >= window_bytes:
+            yield await emit(bytes(buf[:window_bytes]), last=False)
+            del buf[:step_bytes]
+            offset += step_bytes / BYTES_PER_SAMPLE / SAMPLE_RATE
+            index += 1
+
+    # Tail: the rest after the last full window (the whole clip if it was short)
+    if buf:
+        yield await emit(bytes(buf[:len(buf) - len(buf) % BYTES_PER_SAMPLE]), last=True)
+
+    yield {
+        "type": "final",
+        "original_text": " ".join(originals),
+        "translated_text": " ".join(translations),
+        "target_lang": target_lang,
+        # Whisper tiers that served the windows
+        "models": sorted(tiers),
+    }
+
+
+async def websocket_audio_chunks(websocket):
+    """
+    Yield binary audio frames from a WebSocket until the client sends "end"
+    or disconnects.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("bytes"):
+            yield message["bytes"]
+        elif message.get("text") == "end":
+            return
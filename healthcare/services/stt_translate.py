@@ -1,57 +1,368 @@
 # services/stt_translate.py
-import tempfile
-import whisper
-from deep_translator import GoogleTranslator
-from config import WHISPER_MODEL_NAME
+import asyncio
+import hashlib
+import multiprocessing
+from collections import deque
+import re
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pymongo.errors import DuplicateKeyError
+from config import (
+    WHISPER_MODEL_NAME,
+    WHISPER_MODEL_TIERS,
+    WHISPER_MEMORY_BUDGET_MB,
+    WHISPER_WORKERS,
+    WHISPER_THREADS_PER_WORKER,
+    WHISPER_QUEUE_SIZE,
+    WHISPER_BATCH_SIZE,
+    WHISPER_BATCH_WINDOW_MS,
+    WHISPER_BATCH_MAX_SECONDS,
+    STT_MAX_UPLOAD_BYTES,
+    STT_ENABLED,
+)
+from services import whisper_worker
+from services.audio import preprocess, UndecodableAudio
+from services.translation import translate
+from metrics import span
+from schemas import LANG_CODE_PATTERN
 
-# Global Whisper model (loaded once at startup)
-whisper_model = None
+UPLOAD_CHUNK_BYTES = 64 * 1024
+TRANSCRIPTS = "transcripts"
+_lang_code_re = re.compile(LANG_CODE_PATTERN)
+
+# (audio hash, requested model) -> transcription already in progress
+_inflight = {}
+
+# Approximate resident memory per loaded model on CPU (fp32), in MB
+WHISPER_MODEL_MB = {
+    "tiny": 150, "tiny.en": 150,
+    "base": 290, "base.en": 290,
+    "small": 950, "small.en": 950,
+    "medium": 3000, "medium.en": 3000,
+    "large": 6000, "large-v2": 6000, "large-v3": 6000, "turbo": 3200,
+}
+
+
+def plan_tiers(default: str = WHISPER_MODEL_NAME, tiers: list = WHISPER_MODEL_TIERS,
+               budget_mb: int = WHISPER_MEMORY_BUDGET_MB) -> list:
+    """
+    Models each worker loads, smallest first: always the default model, then
+    the other tiers (smallest first) while they fit the memory budget.
+    """
+    def size(name: str) -> float:
+        return WHISPER_MODEL_MB.get(name, float("inf"))
+
+    chosen, used = [default], WHISPER_MODEL_MB.get(default, 0)
+    for name in sorted(set(tiers) - {default}, key=size):
+        if used + size(name) <= budget_mb:
+            chosen.append(name)
+            used += size(name)
+    return sorted(chosen, key=size)
+
+
+class TranscriptionQueueFull(Exception):
+    """Raised when the transcription queue is at capacity (maps to HTTP 429)."""
+
+
+class SpeechToTextDisabled(Exception):
+    """Raised when this process does not run the "stt" role (maps to HTTP 503)."""
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds STT_MAX_UPLOAD_BYTES (maps to HTTP 413)."""
+
+
+class TranscriptionPool:
+    """
+    Runs Whisper in a dedicated process pool so transcription never blocks the
+    event loop. Jobs wait in a bounded queue and go to the next free worker;
+    short clips that queue up together are handed to a worker as one batch
+    (whisper_worker.transcribe_batch decodes them in one forward pass).
+    """
+
+    def __init__(self, models: list = None, workers: int = WHISPER_WORKERS,
+                 queue_size: int = WHISPER_QUEUE_SIZE, batch_size: int = WHISPER_BATCH_SIZE,
+                 batch_window_ms: int = WHISPER_BATCH_WINDOW_MS,
+                 batch_max_seconds: float = WHISPER_BATCH_MAX_SECONDS):
+        self.models = models or plan_tiers()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_samples = int(batch_max_seconds * whisper_worker.SAMPLE_RATE)
+        # Queued (audio, model, future) jobs, oldest first. A job leaves only
+        # when it is handed to a worker, so clips waiting to join a batch
+        # still count against queue_size
+        self._jobs = deque()
+        # Set when a job is queued or a worker frees up
+        self._changed = asyncio.Event()
+        # One slot per worker: the dispatcher only takes jobs when a worker is
+        # free, so excess load stays in the bounded queue and overflows as 429s
+        self._slots = asyncio.Semaphore(workers)
+        self._idle = workers
+        self._executor = None
+        self._dispatcher = None
+
+    async def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=whisper_worker.init_worker,
+            initargs=(self.models, WHISPER_THREADS_PER_WORKER),
+        )
+        loop = asyncio.get_running_loop()
+        # Spawn every worker now so the model loads at startup, not on the first request
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executor, whisper_worker.warmup)
+            for _ in range(self.workers)
+        ])
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def transcribe(self, audio, model: str = None) -> dict:
+        """
+        Queue a clip (file path or 16 kHz float32 array) for transcription and
+        wait for its result: {"text", "language", "segments", "whisper"}.
+        `model` pins one of the loaded tiers (default: chosen per clip).
+        Raises TranscriptionQueueFull if the queue has no room.
+        """
+        if model is not None and model not in self.models:
+            raise ValueError(f"Whisper model {model!r} is not loaded (available: {', '.join(self.models)})")
+        if len(self._jobs) >= self.queue_size:
+            raise TranscriptionQueueFull("Transcription queue is full, retry shortly.")
+        future = asyncio.get_running_loop().create_future()
+        self._jobs.append((audio, model, future))
+        self._changed.set()
+        return await future
+
+    def _is_short(self, job) -> bool:
+        return not isinstance(job[0], str) and len(job[0]) <= self.batch_max_samples
+
+    def _short_queued(self) -> int:
+        return sum(1 for job in self._jobs if self._is_short(job))
+
+    async def _wait_for_change(self, timeout: float = None):
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            self._idle -= 1
+            # Callers that gave up (cancelled futures) need no transcription
+            while not (self._jobs and not self._jobs[0][2].done()):
+                if self._jobs:
+                    self._jobs.popleft()
+                else:
+                    await self._wait_for_change()
+            # Last free worker and a short clip first in line: give clips
+            # arriving together a moment to join its batch, unless another
+            # worker frees up in the meantime
+            if self._idle == 0 and self.batch_size > 1 and self._is_short(self._jobs[0]):
+                deadline = loop.time() + self.batch_window
+                while self._idle == 0 and self._short_queued() < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    await self._wait_for_change(remaining)
+            asyncio.create_task(self._run(self._take_batch()))
+
+    def _take_batch(self) -> list:
+        batch = [self._jobs.popleft()]
+        if not self._is_short(batch[0]):
+            return batch
+        short = [job for job in self._jobs if self._is_short(job) and not job[2].done()]
+        # Share the short clips with the other free workers
+        size = min(self.batch_size, -(-(len(short) + 1) // (self._idle + 1)))
+        taken = {id(job) for job in short[:size - 1]}
+        if taken:
+            batch += short[:size - 1]
+            self._jobs = deque(job for job in self._jobs if id(job) not in taken)
+        return batch
+
+    async def _run(self, batch: list):
+        loop = asyncio.get_running_loop()
+        try:
+            if len(batch) == 1:
+                audio, model, _ = batch[0]
+                results = [await loop.run_in_executor(self._executor, whisper_worker.transcribe_clip, audio, model)]
+            else:
+                results = await loop.run_in_executor(
+                    self._executor, whisper_worker.transcribe_batch, [(audio, model) for audio, model, _ in batch]
+                )
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._idle += 1
+            self._slots.release()
+            self._changed.set()
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(RuntimeError(str(result)))
+            else:
+                future.set_result(result)
+
+
+# Global transcription pool (started at startup, or on first use)
+transcription_pool = None
+_pool_lock = None
 
 async def init_whisper():
     """
-    Initialize Whisper model once during FastAPI startup.
-    """
-    global whisper_model
-    if whisper_model is None:
-        whisper_model = whisper.load_model(WHISPER_MODEL_NAME)
-        print(f"✅ Whisper model '{WHISPER_MODEL_NAME}' loaded successfully.")
-
-async def speech_to_text_and_translate(file, target_lang: str = "en"):
-    """
-    Transcribe speech to text and translate to target language.
-    Supports .mp3, .wav, .webm, and .ogg files.
-    """
-    try:
-        # Detect file extension
-        filename = file.filename.lower()
-        if filename.endswith(".mp3"):
-            suffix = ".mp3"
-        elif filename.endswith(".wav"):
-            suffix = ".wav"
-        elif filename.endswith(".webm"):
-            suffix = ".webm"
-        elif filename.endswith(".ogg"):
-            suffix = ".ogg"
-        else:
-            suffix = ".wav"  # fallback to .wav
-
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await file.read())
-            audio_path = tmp.name
-
-        # Step 1: Transcribe with loaded Whisper model
-        result = whisper_model.transcribe(audio_path)
-        detected_text = result["text"]
-
-        # Step 2: Translate
-        translation = GoogleTranslator(source="auto", target=target_lang).translate(detected_text)
-
-        return {
-            "original_text": detected_text.strip(),
-            "translated_text": translation.strip(),
-            "target_lang": target_lang,
-        }
-
-    except Exception as e:
-        return {"error": str(e)}
+    Start the Whisper process pool (at FastAPI startup, or lazily on the
+    first STT request). Each worker loads the models once in its initializer.
+    """
+    global transcription_pool, _pool_lock
+    if not STT_ENABLED:
+        raise SpeechToTextDisabled("Speech-to-text is not enabled on this server.")
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if transcription_pool is None:
+            pool = TranscriptionPool()
+            await pool.start()
+            transcription_pool = pool
+            print(f"✅ Whisper models {', '.join(pool.models)} loaded in {WHISPER_WORKERS} worker(s).")
+
+async def get_transcription_pool() -> TranscriptionPool:
+    if transcription_pool is None:
+        await init_whisper()
+    return transcription_pool
+
+def whisper_started() -> bool:
+    return transcription_pool is not None
+
+async def shutdown_whisper():
+    global transcription_pool
+    if transcription_pool is not None:
+        await transcription_pool.shutdown()
+        transcription_pool = None
+
+def whisper_models() -> list:
+    """
+    Tiers loaded in the workers (valid per-request overrides); the planned
+    tiers before the pool has started.
+    """
+    return transcription_pool.models if transcription_pool is not None else plan_tiers()
+
+
+async def _read_upload(file) -> tuple:
+    """
+    Buffer the upload, hashing it as the chunks arrive. Returns (bytes, sha256 hex).
+    """
+    data, digest = bytearray(), hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        data += chunk
+        digest.update(chunk)
+        if len(data) > STT_MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Audio upload exceeds {STT_MAX_UPLOAD_BYTES} bytes.")
+    return bytes(data), digest.hexdigest()
+
+
+async def _transcribe_audio(data: bytes, model: str = None) -> dict:
+    audio = await preprocess(data)
+    if len(audio) == 0:
+        # No speech detected: nothing for Whisper to do
+        return {"original_text": "", "language": None, "model": None, "whisper": None}
+    pool = await get_transcription_pool()
+    with span("whisper"):
+        result = await pool.transcribe(audio, model)
+    return {
+        "original_text": result["text"].strip(),
+        "language": result.get("language"),
+        "model": result["whisper"]["model"],
+        # Tier selection details, kept with the stored transcript
+        "whisper": result["whisper"],
+    }
+
+
+async def _transcribe_once(key: tuple, data: bytes, model: str = None) -> dict:
+    # Identical uploads in flight at the same time share one Whisper run
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_transcribe_audio(data, model))
+        _inflight[key] = future
+        future.add_done_callback(lambda f: _inflight.pop(key, None))
+    return await asyncio.shield(future)
+
+
+def _stt_response(transcript: dict, target_lang: str, translated: str, cache_hit: bool) -> dict:
+    return {
+        "original_text": transcript["original_text"],
+        "translated_text": translated,
+        "target_lang": target_lang,
+        "language": transcript.get("language"),
+        "model": transcript.get("model"),
+        "cache_hit": cache_hit,
+    }
+
+
+async def speech_to_text_and_translate(file, db, target_lang: str = "en", model: str = None):
+    """
+    Transcribe speech to text, translate to target language and store the transcript.
+    The upload is decoded in memory (format sniffed from its content: wav,
+    mp3, ogg, webm, ...) and trimmed to its speech before it reaches Whisper.
+    `model` pins a Whisper tier; by default it is chosen per clip.
+
+    Transcripts are keyed on (sha256 of the upload, requested model): a
+    re-uploaded clip returns the stored transcript, and a new target_lang
+    only translates the stored original text.
+
+    Raises UploadTooLarge, UndecodableAudio, TranscriptionQueueFull or
+    SpeechToTextDisabled for the caller to map to a status code.
+    """
+    if not _lang_code_re.match(target_lang):
+        # Never let a client string become a Mongo field path
+        raise ValueError(f"Invalid target_lang {target_lang!r}")
+    data, audio_sha256 = await _read_upload(file)
+    key = {"audio_sha256": audio_sha256, "whisper_model": model or "auto"}
+
+    with span("db_read"):
+        stored = await db[TRANSCRIPTS].find_one(key, {"original_text": 1, "language": 1,
+                                                      "model": 1, "translations": 1})
+    if stored:
+        translated = (stored.get("translations") or {}).get(target_lang)
+        if translated is None:
+            with span("translate_out"):
+                translated = (await translate(stored["original_text"], "auto", target_lang)).strip()
+            with span("db_write"):
+                await db[TRANSCRIPTS].update_one(
+                    {"_id": stored["_id"]}, {"$set": {f"translations.{target_lang}": translated}}
+                )
+        return _stt_response(stored, target_lang, translated, cache_hit=True)
+
+    # Step 1: Transcribe in the Whisper worker pool
+    transcript = await _transcribe_once((audio_sha256, key["whisper_model"]), data, model)
+
+    # Step 2: Translate
+    with span("translate_out"):
+        translated = (await translate(transcript["original_text"], "auto", target_lang)).strip()
+
+    doc = {
+        **key,
+        **transcript,
+        "translated_text": translated,
+        "target_lang": target_lang,
+        "translations": {target_lang: translated},
+        "created_at": datetime.utcnow(),
+    }
+    with span("db_write"):
+        try:
+            await db[TRANSCRIPTS].insert_one(doc)
+        except DuplicateKeyError:
+            # A concurrent upload of the same clip stored it first
+            await db[TRANSCRIPTS].update_one(key, {"$set": {f"translations.{target_lang}": translated}})
+    return _stt_response(transcript, target_lang, translated, cache_hit=False)
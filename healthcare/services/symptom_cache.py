@@ -0,0 +1,181 @@
+# services/symptom_cache.py
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
+import numpy as np
+from pymongo import DESCENDING
+from config import (
+    SYMPTOM_CACHE_SIMILARITY,
+    SYMPTOM_CACHE_MIN_SIMILARITY,
+    SYMPTOM_CACHE_CANDIDATES,
+)
+
+COLLECTION = "symptom_cache"
+# Bump when the key or the cached response format changes so old entries are never served
+KEY_VERSION = "v3"
+VECTOR_DIM = 256
+
+# Filler words that do not change a presentation ("fever and headache since 2 days")
+STOPWORDS = {
+    "a", "an", "and", "the", "i", "im", "am", "have", "has", "had", "having", "my", "me",
+    "is", "are", "was", "of", "for", "since", "with", "from", "also", "some", "feel", "feeling",
+}
+# Words that negate the rest of their clause ("no chest pain")
+NEGATORS = {
+    "no", "not", "without", "never", "nor", "none", "denies", "deny", "dont", "doesnt",
+    "didnt", "isnt", "wasnt", "cant", "cannot",
+}
+CLAUSE_SEPARATOR = " | "
+
+_apostrophe_re = re.compile(r"['’]")
+_decimal_re = re.compile(r"(\d)[.,](\d)")      # 38.5 -> 38_5 (kept as one token)
+_unit_re = re.compile(r"(\d)([^\W\d_]+)")      # 2days -> 2 days
+_clause_re = re.compile(r"[.,;:!?()/\n]+")
+_word_re = re.compile(r"[^\w\s]+")
+
+# Response fields that are reused on a hit (the rest belong to the request)
+REQUEST_FIELDS = {"conversation_id", "input_text", "cache_hit"}
+
+
+def _split_on(words: list, separator: str) -> list:
+    groups = [[]]
+    for word in words:
+        if word == separator:
+            groups.append([])
+        else:
+            groups[-1].append(word)
+    return groups
+
+
+def normalize_symptoms(text: str) -> str:
+    """
+    Case- and punctuation-insensitive form of the symptom text. Clauses
+    ("fever, dry cough" / "fever and dry cough") may come in any order, but
+    the words inside a clause keep theirs, so negations and numbers stay
+    attached to what they qualify ("fever, no cough" != "cough, no fever").
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _unit_re.sub(r"\1 \2", _decimal_re.sub(r"\1_\2", _apostrophe_re.sub("", text)))
+    clauses = set()
+    for part in _clause_re.split(text):
+        words = _word_re.sub(" ", part).split()
+        # "and" separates findings, unless a negation may span it ("no fever and cough")
+        groups = [words] if NEGATORS.intersection(words) else _split_on(words, "and")
+        for group in groups:
+            group = [w for w in group if w not in STOPWORDS]
+            if group:
+                clauses.add(" ".join(group))
+    return CLAUSE_SEPARATOR.join(sorted(clauses))
+
+
+def _clauses(normalized: str) -> list:
+    return [clause.split() for clause in normalized.split(CLAUSE_SEPARATOR) if clause]
+
+
+def similarity_guard(normalized: str) -> str:
+    """
+    The parts of a presentation that must match exactly before the
+    similarity pass may reuse an entry: every number with the word after it
+    ("2 days", "38_5 fever") and every negated clause.
+    """
+    parts = []
+    for words in _clauses(normalized):
+        for i, word in enumerate(words):
+            if any(ch.isdigit() for ch in word):
+                parts.append(" ".join(words[i:i + 2]))
+        negated = next((i for i, word in enumerate(words) if word in NEGATORS), None)
+        if negated is not None:
+            parts.append(" ".join(words[negated:]))
+    return CLAUSE_SEPARATOR.join(sorted(parts))
+
+
+def age_band(age) -> str:
+    if age is None:
+        return "unknown"
+    for upper, band in ((5, "0-4"), (13, "5-12"), (18, "13-17"), (40, "18-39"), (60, "40-59")):
+        if age < upper:
+            return band
+    return "60+"
+
+
+def _term_list(values) -> str:
+    return ",".join(sorted({v.strip().lower() for v in (values or [])}))
+
+
+def profile_segment(age, sex, allergies, chronic_conditions=None, medications=None) -> str:
+    """
+    Hash of the profile fields that change the advice (the prompt includes
+    conditions and medications, and the advice recommends medicines); only
+    entries with the same segment are ever reused for a request.
+    """
+    raw = "|".join((KEY_VERSION, age_band(age), (sex or "unknown").lower(), _term_list(allergies),
+                    _term_list(chronic_conditions), _term_list(medications)))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def embed(normalized: str) -> np.ndarray:
+    """
+    Cheap local embedding: hashed character trigrams, L2-normalised. Words
+    after a negator are marked ("not_cough") so they embed differently.
+    """
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for words in _clauses(normalized):
+        negated = False
+        for word in words:
+            if word in NEGATORS:
+                negated = True
+                continue
+            padded = f" {'not_' if negated else ''}{word} "
+            for i in range(len(padded) - 2):
+                digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def cache_keys(text: str, age, sex, allergies, chronic_conditions=None, medications=None) -> tuple:
+    normalized = normalize_symptoms(text)
+    segment = profile_segment(age, sex, allergies, chronic_conditions, medications)
+    key = hashlib.sha1(f"{segment}|{normalized}".encode("utf-8")).hexdigest()
+    return normalized, segment, key
+
+
+async def lookup(db, text: str, age, sex, allergies, chronic_conditions=None, medications=None):
+    """
+    Return a cached response dict for an equivalent presentation, or None.
+    Tries the exact normalised key first, then (optionally) the most similar
+    recent entry in the same profile segment with the same numbers and negations.
+    """
+    normalized, segment, key = cache_keys(text, age, sex, allergies, chronic_conditions, medications)
+    doc = await db[COLLECTION].find_one({"key": key}, {"response": 1})
+    if doc:
+        return doc["response"]
+    if not SYMPTOM_CACHE_SIMILARITY or not normalized:
+        return None
+
+    candidates = await db[COLLECTION].find(
+        {"segment": segment, "guard": similarity_guard(normalized)}, {"vector": 1, "response": 1}
+    ).sort("created_at", DESCENDING).limit(SYMPTOM_CACHE_CANDIDATES).to_list(SYMPTOM_CACHE_CANDIDATES)
+    if not candidates:
+        return None
+    scores = np.asarray([c["vector"] for c in candidates], dtype=np.float32) @ embed(normalized)
+    best = int(np.argmax(scores))
+    return candidates[best]["response"] if scores[best] >= SYMPTOM_CACHE_MIN_SIMILARITY else None
+
+
+async def store(db, text: str, age, sex, allergies, chronic_conditions, medications, response: dict):
+    normalized, segment, key = cache_keys(text, age, sex, allergies, chronic_conditions, medications)
+    await db[COLLECTION].update_one(
+        {"key": key},
+        {"$set": {
+            "key": key,
+            "segment": segment,
+            "normalized": normalized,
+            "guard": similarity_guard(normalized),
+            "vector": [round(float(x), 4) for x in embed(normalized)],
+            "response": {k: v for k, v in response.items() if k not in REQUEST_FIELDS},
+            "created_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
@@ -1,6 +1,52 @@
-import requests
+import json
+import fastjsonschema
+import orjson
 from schemas import SymptomCheckRequest, SymptomCheckResponse
-from config import GROQ_API_KEY, GROQ_MODEL, GROQ_BASE_URL
+from config import GROQ_API_KEY, SYMPTOM_CACHE_ENABLED, SYMPTOM_RESPONSE_FORMAT
+from services.llm_client import get_llm_client
+from services.profile_context import get_profile_context
+from services import symptom_cache
+from metrics import span
+
+
+# JSON the model must return: the analysis fields of SymptomCheckResponse
+_string_list = {"type": "array", "items": {"type": "string"}}
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "probable_conditions": _string_list,
+        "recommendations": _string_list,
+        "recommended_tests": _string_list,
+        "recommended_medicines": _string_list,
+    },
+    "required": ["summary", "probable_conditions", "recommendations",
+                 "recommended_tests", "recommended_medicines"],
+    "additionalProperties": False,
+}
+# Compiled once at import; validating a parsed response is then a plain function call
+validate_analysis = fastjsonschema.compile(ANALYSIS_SCHEMA)
+
+
+def _response_format() -> dict:
+    if SYMPTOM_RESPONSE_FORMAT == "json_schema":
+        return {"type": "json_schema",
+                "json_schema": {"name": "symptom_check", "schema": ANALYSIS_SCHEMA, "strict": True}}
+    return {"type": "json_object"}
+
+
+def parse_analysis(content: str) -> dict:
+    """
+    Parse and validate the model's JSON. Tolerates markdown code fences and
+    surrounding prose; raises ValueError if the JSON is malformed or off-schema.
+    """
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in response")
+    try:
+        return validate_analysis(orjson.loads(content[start:end + 1]))
+    except (orjson.JSONDecodeError, fastjsonschema.JsonSchemaValueException) as e:
+        raise ValueError(str(e)) from e
 
 
 async def analyze_symptoms(request: SymptomCheckRequest, db) -> SymptomCheckResponse:
@@ -12,13 +58,33 @@ async def analyze_symptoms(request: SymptomCheckRequest, db) -> SymptomCheckResp
     # -------------------------
     # Fetch patient profile if exists
     # -------------------------
-    profile = await db["patients"].find_one({"patient_id": request.conversation_id})
-    profile_context = ""
-    if profile:
-        allergies = ", ".join(profile.get("allergies", []))
-        chronic = ", ".join(profile.get("chronic_conditions", []))
-        meds = ", ".join(profile.get("medications", []))
-        profile_context = f"\n\nPatient Profile:\n- Age: {profile.get('age')}\n- Sex: {profile.get('sex')}\n- Allergies: {allergies}\n- Chronic Conditions: {chronic}\n- Current Medications: {meds}"
+    with span("db_read"):
+        profile, profile_context = await get_profile_context(db, request.conversation_id)
+    profile = profile or {}
+
+    # -------------------------
+    # Response cache (keyed on normalised symptoms + age band, sex, allergies,
+    # chronic conditions and medications)
+    # -------------------------
+    use_cache = SYMPTOM_CACHE_ENABLED and request.use_cache
+    cache_args = (
+        text,
+        request.age if request.age is not None else profile.get("age"),
+        request.sex or profile.get("sex"),
+        profile.get("allergies"),
+        profile.get("chronic_conditions"),
+        profile.get("medications"),
+    )
+    if use_cache:
+        with span("db_read"):
+            cached = await symptom_cache.lookup(db, *cache_args)
+        if cached:
+            return SymptomCheckResponse(
+                conversation_id=request.conversation_id,
+                input_text=text,
+                cache_hit=True,
+                **cached,
+            )
 
     # -------------------------
     # Build prompt
@@ -28,38 +94,51 @@ Patient symptoms: {text}
 {profile_context}
 
 Task: As a medical assistant, provide:
-1. A short summary of the symptoms
-2. Possible conditions (not a definitive diagnosis, just probabilities)
-3. General lifestyle/precaution recommendations
-4. Recommended medical tests (lab tests, imaging, etc.)
-5. Suggested over-the-counter medicines or home remedies (safe, non-prescription only)
+1. summary: A short summary of the symptoms
+2. probable_conditions: Possible conditions (not a definitive diagnosis, just probabilities)
+3. recommendations: General lifestyle/precaution recommendations
+4. recommended_tests: Recommended medical tests (lab tests, imaging, etc.)
+5. recommended_medicines: Suggested over-the-counter medicines or home remedies (safe, non-prescription only)
 
 ⚠️ Do not prescribe antibiotics or strong medications. Always advise consulting a doctor.
+
+Reply with only a JSON object matching this JSON schema:
+{json.dumps(ANALYSIS_SCHEMA)}
 """
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    data = {
-        "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.6
-    }
-
-    resp = requests.post(GROQ_BASE_URL, headers=headers, json=data)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Groq API error: {resp.text}")
-
-    ai_content = resp.json()["choices"][0]["message"]["content"]
-
-    return SymptomCheckResponse(
-        conversation_id=request.conversation_id,
-        input_text=text,
-        summary=f"Patient reports: {text}",
-        probable_conditions=[ai_content],  # store raw AI output
-        recommendations=["Consult doctor", "Follow safe medical practices"],
-        recommended_tests=["Blood test", "Chest X-ray"],   # fallback examples
-        recommended_medicines=["Paracetamol", "ORS"]       # fallback examples
-    )
+    messages = [{"role": "user", "content": prompt}]
+    llm = get_llm_client()
+    with span("llm"):
+        ai_content = await llm.chat(messages, temperature=0.6, response_format=_response_format())
+
+    try:
+        analysis = parse_analysis(ai_content)
+    except ValueError as e:
+        # One cheap repair attempt, only when the JSON is malformed
+        repair = messages + [
+            {"role": "assistant", "content": ai_content},
+            {"role": "user", "content": f"That was not valid JSON for the schema ({e}). "
+                                        "Reply with only the corrected JSON object."},
+        ]
+        with span("llm"):
+            ai_content = await llm.chat(repair, temperature=0, response_format=_response_format())
+        try:
+            analysis = parse_analysis(ai_content)
+        except ValueError:
+            analysis = None
+
+    if analysis is None:
+        # Still unparseable: keep the raw text so nothing is lost, and do not cache it
+        return SymptomCheckResponse(
+            conversation_id=request.conversation_id,
+            input_text=text,
+            summary=f"Patient reports: {text}",
+            probable_conditions=[ai_content],
+            recommendations=["Consult doctor", "Follow safe medical practices"],
+        )
+
+    result = SymptomCheckResponse(conversation_id=request.conversation_id, input_text=text, **analysis)
+    if use_cache:
+        with span("db_write"):
+            await symptom_cache.store(db, *cache_args, result.dict())
+    return result
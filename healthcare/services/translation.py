@@ -0,0 +1,74 @@
+# services/translation.py
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+from config import TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL, TRANSLATION_WORKERS
+
+# (text hash, source, target) -> translated text
+_cache = LRUCache(maxsize=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL)
+# Same key -> future of the network call already in progress
+_inflight = {}
+# Translation is blocking network I/O, so it runs on its own threads
+_executor = ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="translate")
+_local = threading.local()
+
+
+def _cache_key(text: str, source: str, target: str) -> tuple:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest(), source, target
+
+
+def _translate_sync(text: str, source: str, target: str) -> str:
+    # GoogleTranslator keeps per-call request state on the instance, so each
+    # thread reuses its own translator per language pair
+    translators = getattr(_local, "translators", None)
+    if translators is None:
+        translators = _local.translators = {}
+    translator = translators.get((source, target))
+    if translator is None:
+        # Imported on first use: deep_translator pulls in requests and bs4
+        from deep_translator import GoogleTranslator
+        translator = translators[(source, target)] = GoogleTranslator(source=source, target=target)
+    return translator.translate(text) or ""
+
+
+def _on_done(key: tuple, future: asyncio.Future):
+    _inflight.pop(key, None)
+    if not future.cancelled() and future.exception() is None:
+        _cache.set(key, future.result())
+
+
+async def translate(text: str, source: str = "auto", target: str = "en") -> str:
+    """
+    Translate text off the event loop. Results are cached, and concurrent
+    requests for the same (text, source, target) share a single network call.
+    """
+    if not text or not text.strip() or (source != "auto" and source == target):
+        return text
+
+    key = _cache_key(text, source, target)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(
+            _executor, _translate_sync, text, source, target
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda f: _on_done(key, f))
+    # Shield so one cancelled caller does not cancel the shared call for the others
+    return await asyncio.shield(future)
+
+
+async def translate_batch(texts: list, source: str = "auto", target: str = "en") -> list:
+    """
+    Translate many segments at once. Duplicates are translated once and
+    cache hits skip the network entirely; results keep the input order.
+    """
+    unique = list(dict.fromkeys(texts))
+    results = await asyncio.gather(*[translate(text, source, target) for text in unique])
+    translated = dict(zip(unique, results))
+    return [translated[text] for text in texts]
@@ -0,0 +1,209 @@
+# services/whisper_worker.py
+# Runs inside the transcription process pool: each worker process loads
+# its Whisper model tiers once and then transcribes single clips or
+# batches of short ones.
+# whisper/torch are imported inside the functions, so importing this module
+# in the API process stays cheap; only the worker processes load them.
+import os
+from config import (
+    WHISPER_MODEL_NAME,
+    WHISPER_DETECT_SECONDS,
+    WHISPER_FAST_MAX_SECONDS,
+    WHISPER_FAST_MIN_LANG_PROB,
+    WHISPER_ESCALATE_LANG_PROB,
+    WHISPER_ESCALATE_LOGPROB,
+)
+
+SAMPLE_RATE = 16000
+# Batched greedy output above this gzip compression ratio is repetitive
+# (Whisper's own temperature-fallback threshold)
+COMPRESSION_RATIO_MAX = 2.4
+
+# Per-process Whisper models, smallest first (set by init_worker)
+models = {}
+tiers = []
+
+def init_worker(model_names: list, num_threads: int):
+    """
+    Process pool initializer: pin torch threads and load every tier once.
+    """
+    global tiers
+    import torch
+    import whisper
+    torch.set_num_threads(num_threads)
+    tiers = list(model_names)
+    for name in tiers:
+        models[name] = whisper.load_model(name)
+
+def warmup() -> int:
+    # Forces the pool to spawn (and initialize) a worker
+    return os.getpid()
+
+def _default_tier() -> str:
+    return WHISPER_MODEL_NAME if WHISPER_MODEL_NAME in models else tiers[-1]
+
+def _larger_tier(name: str):
+    index = tiers.index(name)
+    return tiers[index + 1] if index + 1 < len(tiers) else None
+
+def detect_language(audio) -> tuple:
+    """
+    Language ID on the first seconds of the clip with the smallest tier.
+    Returns (language, probability).
+    """
+    import whisper
+    model = models[tiers[0]]
+    clip = whisper.pad_or_trim(audio[:int(WHISPER_DETECT_SECONDS * SAMPLE_RATE)])
+    mel = whisper.log_mel_spectrogram(clip, model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    language = max(probs, key=probs.get)
+    return language, float(probs[language])
+
+def _mels(clips: list, model):
+    # One padded 30 s log-mel window per clip, stacked into a batch
+    import torch
+    import whisper
+    return torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels) for audio in clips
+    ]).to(model.device)
+
+def detect_languages(clips: list) -> list:
+    """
+    detect_language for several clips in one forward pass.
+    Returns [(language, probability), ...] in order.
+    """
+    model = models[tiers[0]]
+    _, probs = model.detect_language(_mels([a[:int(WHISPER_DETECT_SECONDS * SAMPLE_RATE)] for a in clips], model))
+    detected = []
+    for p in probs:
+        language = max(p, key=p.get)
+        detected.append((language, float(p[language])))
+    return detected
+
+def choose_tier(duration: float, language_prob: float) -> str:
+    """
+    Short clips with a confidently detected language go to the smallest tier,
+    unclear ones to the largest; everything else to the configured default.
+    """
+    if duration <= WHISPER_FAST_MAX_SECONDS and language_prob >= WHISPER_FAST_MIN_LANG_PROB:
+        return tiers[0]
+    if language_prob < WHISPER_ESCALATE_LANG_PROB:
+        return tiers[-1]
+    return _default_tier()
+
+def _escalate(audio, result: dict, tier: str, language: str) -> int:
+    """
+    Re-run low-confidence segments on the next larger tier, in place.
+    Returns the number of segments replaced.
+    """
+    larger = _larger_tier(tier)
+    if larger is None:
+        return 0
+    replaced = 0
+    for seg in result["segments"]:
+        if seg.get("avg_logprob", 0.0) >= WHISPER_ESCALATE_LOGPROB:
+            continue
+        piece = audio[int(seg["start"] * SAMPLE_RATE):int(seg["end"] * SAMPLE_RATE)]
+        if len(piece) == 0:
+            continue
+        retry = models[larger].transcribe(piece, language=language, condition_on_previous_text=False)
+        retry_segments = retry.get("segments", [])
+        if not retry_segments:
+            continue
+        logprob = sum(s["avg_logprob"] for s in retry_segments) / len(retry_segments)
+        if logprob > seg["avg_logprob"]:
+            seg["text"], seg["avg_logprob"] = retry["text"], logprob
+            replaced += 1
+    if replaced:
+        result["text"] = "".join(seg["text"] for seg in result["segments"])
+    return replaced
+
+def transcribe_clip(audio, model: str = None) -> dict:
+    """
+    Transcribe one clip (file path or 16 kHz float32 array). `model` pins a
+    tier; otherwise a language-ID pass picks it and weak segments escalate.
+    """
+    if isinstance(audio, str):
+        import whisper
+        audio = whisper.load_audio(audio)
+    duration = len(audio) / SAMPLE_RATE
+
+    language, language_prob = None, None
+    tier = model
+    if tier is None:
+        if len(tiers) > 1:
+            language, language_prob = detect_language(audio)
+            tier = choose_tier(duration, language_prob)
+        else:
+            tier = tiers[0]
+
+    # A known language skips Whisper's own detection pass
+    result = models[tier].transcribe(audio, language=language)
+    segments = [
+        {"start": seg["start"], "end": seg["end"], "text": seg["text"],
+         "avg_logprob": seg.get("avg_logprob", 0.0)}
+        for seg in result.get("segments", [])
+    ]
+    output = {"text": result["text"], "language": result.get("language", language), "segments": segments}
+    escalated = _escalate(audio, output, tier, output["language"]) if model is None else 0
+    output["whisper"] = {
+        "model": tier,
+        "language_probability": language_prob,
+        "escalated_segments": escalated,
+    }
+    return output
+
+def transcribe_batch(clips: list) -> list:
+    """
+    Transcribe short (audio, model) clips, each within one 30 s window,
+    together: one batched language-ID pass, then one batched decode per
+    (tier, language). Clips the greedy batch decode is unsure about (low
+    log-probability or repetitive text) are redone with transcribe_clip,
+    which has temperature fallback and tier escalation. Returns one result,
+    or the exception it raised, per clip, in order.
+    """
+    import whisper
+    auto = [i for i, (_, model) in enumerate(clips) if model is None]
+    detected = {}
+    if auto and len(tiers) > 1:
+        detected = dict(zip(auto, detect_languages([clips[i][0] for i in auto])))
+
+    groups = {}
+    for i, (audio, model) in enumerate(clips):
+        language, language_prob = detected.get(i, (None, None))
+        tier = model
+        if tier is None:
+            tier = choose_tier(len(audio) / SAMPLE_RATE, language_prob) if language_prob is not None else tiers[0]
+        groups.setdefault((tier, language), []).append(i)
+
+    results = [None] * len(clips)
+    for (tier, language), indexes in groups.items():
+        model = models[tier]
+        options = whisper.DecodingOptions(language=language, without_timestamps=True,
+                                          fp16=model.device.type == "cuda")
+        try:
+            decoded = whisper.decode(model, _mels([clips[i][0] for i in indexes], model), options)
+        except Exception:
+            decoded = [None] * len(indexes)
+        for i, result in zip(indexes, decoded):
+            audio, pinned = clips[i]
+            if (result is None or result.avg_logprob < WHISPER_ESCALATE_LOGPROB
+                    or result.compression_ratio > COMPRESSION_RATIO_MAX):
+                try:
+                    results[i] = transcribe_clip(audio, pinned)
+                except Exception as e:
+                    results[i] = e
+                continue
+            results[i] = {
+                "text": result.text,
+                "language": result.language,
+                "segments": [{"start": 0.0, "end": len(audio) / SAMPLE_RATE, "text": result.text,
+                              "avg_logprob": result.avg_logprob}],
+                "whisper": {
+                    "model": tier,
+                    "language_probability": detected.get(i, (None, None))[1],
+                    "escalated_segments": 0,
+                    "batch_size": len(clips),
+                },
+            }
+    return results
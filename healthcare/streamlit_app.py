@@ -1,12 +1,7 @@
 # app.py (Streamlit Frontend)
 import streamlit as st
-import requests
-import json
-
-# -------------------------------
-# Backend API Base URL
-# -------------------------------
-API_URL = "http://127.0.0.1:8000"  # change if backend is remote
+import api_client
+from api_client import ApiError
 
 # -------------------------------
 # Streamlit Config
@@ -14,6 +9,12 @@ API_URL = "http://127.0.0.1:8000"  # change if backend is remote
 st.set_page_config(page_title="Rural Healthcare", page_icon="🩺", layout="wide")
 st.title("🩺 Rural Healthcare Web App")
 
+
+def show_messages(messages: list):
+    for msg in messages:
+        role = "🧑 Patient" if msg["role"] == "patient" else "👨‍⚕️ Doctor"
+        st.markdown(f"**{role}:** {msg['text']}")
+
 # -------------------------------
 # Sidebar Navigation
 # -------------------------------
@@ -28,32 +29,25 @@ menu = st.sidebar.radio(
 if menu == "Chat":
     st.header("💬 Doctor–Patient Chat")
 
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-
     conversation_id = st.text_input("Conversation ID", value="conv001")
 
-    # Show chat history
-    for msg in st.session_state.chat_history:
-        role = "🧑 Patient" if msg["role"] == "patient" else "👨‍⚕️ Doctor"
-        st.markdown(f"**{role}:** {msg['text']}")
-
-    # Input box
+    # Input box (handled first so the new turn shows up in the history below)
     user_input = st.text_input("Type your message:")
     if st.button("Send"):
         if user_input.strip():
-            payload = {
-                "conversation_id": conversation_id,
-                "message": user_input,
-                "source_lang": "auto",
-                "target_lang": "en",
-            }
-            response = requests.post(f"{API_URL}/chat/", json=payload)
-            if response.status_code == 200:
-                result = response.json()
-                st.session_state.chat_history = result["history"]
-            else:
-                st.error(f"Error: {response.text}")
+            try:
+                api_client.send_chat(conversation_id, user_input)
+            except ApiError as e:
+                st.error(f"Error: {e}")
+
+    # Show chat history
+    try:
+        conversation = api_client.load_conversation(conversation_id)
+        if conversation["has_older"] and st.button("Load older messages"):
+            conversation = api_client.load_older(conversation_id)
+        show_messages(conversation["messages"])
+    except ApiError as e:
+        st.error(f"Error: {e}")
 
 # -------------------------------
 # Symptom Checker Page
@@ -73,9 +67,11 @@ elif menu == "Symptom Checker":
             "age": age,
             "sex": sex,
         }
-        response = requests.post(f"{API_URL}/symptom-check/", json=payload)
-        if response.status_code == 200:
-            result = response.json()
+        try:
+            result = api_client.check_symptoms(payload)
+        except ApiError as e:
+            st.error(f"Error: {e}")
+        else:
             st.subheader("Summary")
             st.write(result["summary"])
 
@@ -92,8 +88,6 @@ elif menu == "Symptom Checker":
             if result.get("recommended_medicines"):
                 st.subheader("Recommended Medicines")
                 st.write(result["recommended_medicines"])
-        else:
-            st.error(f"Error: {response.text}")
 
 # -------------------------------
 # Audio STT + Translation Page
@@ -109,18 +103,14 @@ elif menu == "Audio STT + Translation":
         st.audio(uploaded_file, format="audio/mp3")
 
         if st.button("Transcribe & Translate"):
-            files = {"file": uploaded_file.getvalue()}
-            response = requests.post(
-                f"{API_URL}/stt-translate/?target_lang={target_lang}",
-                files={"file": (uploaded_file.name, uploaded_file, uploaded_file.type)},
-            )
-            if response.status_code == 200:
-                result = response.json()
+            try:
+                result = api_client.transcribe(uploaded_file, target_lang)
+            except ApiError as e:
+                st.error(f"Error: {e}")
+            else:
                 st.success("✅ Transcription Complete")
                 st.write(f"**Original:** {result['original_text']}")
                 st.write(f"**Translated ({target_lang}):** {result['translated_text']}")
-            else:
-                st.error(f"Error: {response.text}")
 
 # -------------------------------
 # Patient Dashboard Page
@@ -130,24 +120,38 @@ elif menu == "Patient Dashboard":
 
     patient_id = st.text_input("Enter Patient ID", value="patient001")
 
+    # Buttons only reveal the sections; the data comes from the client caches,
+    # so reruns (any widget change) don't download it again
     if st.button("Fetch Patient Profile"):
-        response = requests.get(f"{API_URL}/patients/{patient_id}")
-        if response.status_code == 200:
-            profile = response.json()
-            st.subheader("👤 Patient Profile")
-            st.json(profile)
+        st.session_state.show_profile = True
+    if st.session_state.get("show_profile"):
+        if st.button("🔄 Refresh profile"):
+            api_client.fetch_patient.clear()
+        try:
+            profile = api_client.fetch_patient(patient_id)
+        except ApiError as e:
+            st.error(f"Error: {e}")
         else:
-            st.error("❌ Patient not found")
+            if profile:
+                st.subheader("👤 Patient Profile")
+                st.json(profile)
+            else:
+                st.error("❌ Patient not found")
 
     conversation_id = st.text_input("Conversation ID (for history)", value="conv001")
 
     if st.button("Fetch Conversation History"):
-        response = requests.get(f"{API_URL}/chat/{conversation_id}")
-        if response.status_code == 200:
-            history = response.json()
-            st.subheader("💬 Conversation History")
-            for msg in history["history"]:
-                role = "🧑 Patient" if msg["role"] == "patient" else "👨‍⚕️ Doctor"
-                st.markdown(f"**{role}:** {msg['text']}")
+        st.session_state.show_history = True
+    if st.session_state.get("show_history"):
+        try:
+            conversation = api_client.load_conversation(conversation_id)
+            if conversation["has_older"] and st.button("Load older messages", key="dashboard_older"):
+                conversation = api_client.load_older(conversation_id)
+        except ApiError as e:
+            st.error(f"Error: {e}")
         else:
-            st.error("❌ No conversation found")
+            if conversation["messages"]:
+                st.subheader("💬 Conversation History")
+                show_messages(conversation["messages"])
+            else:
+                st.error("❌ No conversation found")
@@ -0,0 +1,144 @@
+import asyncio
+import ipaddress
+import pytest
+from bson import ObjectId
+from local_store import LocalDatabase
+from services.audio import UndecodableAudio
+from services import jobs
+from services.jobs import JobWorker, InvalidCallbackURL, check_callback_url, submit_job
+
+
+@pytest.fixture
+def db(tmp_path):
+    return LocalDatabase(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claims_follow_priority_then_age(db):
+    async def scenario():
+        for name, priority in (("low", 0), ("high", 5), ("low-2", 0), ("high-2", 5)):
+            await submit_job(db, "symptom_check", {"name": name}, priority)
+        worker = JobWorker(db, lease_sec=60)
+        claimed = [await worker._claim(["symptom_check"]) for _ in range(5)]
+        return [job and job["payload"]["name"] for job in claimed]
+
+    assert asyncio.run(scenario()) == ["high", "high-2", "low", "low-2", None]
+
+
+def test_expired_lease_is_claimed_again(db):
+    async def scenario():
+        await submit_job(db, "symptom_check", {})
+        crashed, other = JobWorker(db, lease_sec=0.2), JobWorker(db, lease_sec=60)
+        other.worker_id = "other:1"
+        first = await crashed._claim(["symptom_check"])
+        while_leased = await other._claim(["symptom_check"])
+        await asyncio.sleep(0.3)
+        reclaimed = await other._claim(["symptom_check"])
+        return first, while_leased, reclaimed
+
+    first, while_leased, reclaimed = asyncio.run(scenario())
+    assert while_leased is None
+    assert reclaimed["_id"] == first["_id"]
+    assert (reclaimed["worker"], reclaimed["attempts"]) == ("other:1", 2)
+
+
+def test_worker_runs_jobs_to_completion(db, monkeypatch):
+    async def handler(job, db):
+        return {"echo": job["payload"]["n"]}
+
+    monkeypatch.setitem(jobs.HANDLERS, "symptom_check", handler)
+
+    async def scenario():
+        worker = JobWorker(db, poll_interval=0.05)
+        worker.start()
+        submitted = [await submit_job(db, "symptom_check", {"n": n}) for n in range(3)]
+        for _ in range(100):
+            statuses = [await jobs.get_job(db, s["job_id"]) for s in submitted]
+            if all(s["status"] == jobs.DONE for s in statuses):
+                break
+            await asyncio.sleep(0.02)
+        await worker.stop()
+        return statuses
+
+    assert [s["result"] for s in asyncio.run(scenario())] == [{"echo": 0}, {"echo": 1}, {"echo": 2}]
+
+
+@pytest.mark.parametrize("error, expected", [
+    (UndecodableAudio("Could not decode audio"), jobs.FAILED),
+    (ValueError("Invalid target_lang 'xx-'"), jobs.FAILED),
+    (RuntimeError("model crashed"), jobs.QUEUED),
+])
+def test_only_transient_errors_are_retried(db, monkeypatch, error, expected):
+    async def handler(job, db):
+        raise error
+
+    monkeypatch.setitem(jobs.HANDLERS, "symptom_check", handler)
+
+    async def scenario():
+        submitted = await submit_job(db, "symptom_check", {})
+        worker = JobWorker(db)
+        await worker._execute(await worker._claim(["symptom_check"]))
+        return await jobs.get_job(db, submitted["job_id"])
+
+    status = asyncio.run(scenario())
+    assert (status["status"], status["error"]) == (expected, str(error))
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "http://127.0.0.1:8000/hook",
+    "http://localhost/hook",
+    "http://10.1.2.3/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[fd00::1]/hook",
+    "http://224.0.0.1/hook",
+    "https:///no-host",
+])
+def test_callback_urls_into_the_local_network_are_rejected(url):
+    with pytest.raises(InvalidCallbackURL):
+        asyncio.run(check_callback_url(url, set()))
+
+
+def test_callback_url_allowlist():
+    asyncio.run(check_callback_url("https://8.8.8.8/hook", set()))
+    asyncio.run(check_callback_url("http://emr.local/hook", {"emr.local"}))
+    with pytest.raises(InvalidCallbackURL):
+        asyncio.run(check_callback_url("https://8.8.8.8/hook", {"emr.local"}))
+
+
+def test_submit_rejects_bad_callback(db):
+    async def scenario():
+        with pytest.raises(InvalidCallbackURL):
+            await submit_job(db, "symptom_check", {}, callback_url="http://127.0.0.1/hook")
+        return await db[jobs.JOBS].count_documents({})
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_webhook_connects_to_the_checked_address(db, monkeypatch):
+    async def getaddrinfo(self, host, port, **kwargs):
+        return [(None, None, None, "", ("93.184.216.34", port))]
+
+    class RecordingClient:
+        async def post(self, url, **kwargs):
+            self.sent = url, kwargs
+            return type("Response", (), {"status_code": 204})()
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+    async def scenario():
+        job = await submit_job(db, "symptom_check", {}, callback_url="https://hooks.example.com:8443/done?x=1")
+        worker = JobWorker(db)
+        worker._http = RecordingClient()
+        await worker._deliver(ObjectId(job["job_id"]))
+        return worker._http.sent
+
+    url, kwargs = asyncio.run(scenario())
+    assert url == "https://93.184.216.34:8443/done?x=1"
+    assert kwargs["headers"] == {"Host": "hooks.example.com:8443"}
+    assert kwargs["extensions"] == {"sni_hostname": "hooks.example.com"}
+
+
+def test_pinned_request_brackets_ipv6():
+    url, headers, _ = jobs.pinned_request("http://user@hooks.example.com/done", ipaddress.ip_address("2606:4700::1"))
+    assert (url, headers) == ("http://user@[2606:4700::1]/done", {"Host": "hooks.example.com"})
@@ -0,0 +1,42 @@
+import asyncio
+import json
+import httpx
+from services.llm_client import LLMClient
+
+
+def _sse(*tokens) -> bytes:
+    events = [f"data: {json.dumps({'choices': [{'delta': {'content': t}}]})}" for t in tokens]
+    return ("\n\n".join(events + ["data: [DONE]"]) + "\n\n").encode()
+
+
+def test_slow_stream_reader_does_not_hold_the_llm_slot():
+    def handler(request):
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, content=_sse("Hel", "lo"))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "done"}}]})
+
+    async def scenario():
+        llm = LLMClient(api_key="test", max_concurrency=1)
+        llm._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        stream = llm.stream_chat([{"role": "user", "content": "hi"}])
+        first = await stream.__anext__()
+        # The stream consumer is paused mid-answer; another request still gets the only slot
+        other = await asyncio.wait_for(llm.chat([{"role": "user", "content": "hi"}]), 1)
+        rest = [token async for token in stream]
+        await llm.aclose()
+        return first, other, rest
+
+    assert asyncio.run(scenario()) == ("Hel", "done", ["lo"])
+
+
+def test_stream_errors_reach_the_consumer():
+    async def scenario():
+        llm = LLMClient(api_key="test", max_retries=0)
+        llm._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(400, text="bad")))
+        try:
+            async for _ in llm.stream_chat([{"role": "user", "content": "hi"}]):
+                pass
+        except RuntimeError as e:
+            return str(e)
+
+    assert asyncio.run(scenario()) == "Groq API error: bad"
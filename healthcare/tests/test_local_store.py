@@ -0,0 +1,211 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from local_store import LocalDatabase, apply_update, matches, sync_outbox
+
+T0 = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return LocalDatabase(str(tmp_path / "edge.sqlite3"), outbox_collections=["chats", "patients"])
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"status": "queued"}, True),
+    ({"status": {"$in": ["running", "queued"]}}, True),
+    ({"status": {"$nin": ["queued"]}}, False),
+    ({"tags": "urgent"}, True),
+    ({"meta.site": "north"}, True),
+    ({"missing": None}, True),
+    ({"missing": {"$exists": False}}, True),
+    ({"priority": {"$gte": 2, "$lt": 5}}, True),
+    ({"priority": {"$gt": "2"}}, False),
+    ({"created_at": {"$lte": T0}}, True),
+    ({"$or": [{"status": "done"}, {"priority": 2}]}, True),
+    ({"$and": [{"status": "queued"}, {"priority": {"$ne": 2}}]}, False),
+])
+def test_matches(query, expected):
+    doc = {"status": "queued", "priority": 2, "tags": ["urgent"], "meta": {"site": "north"}, "created_at": T0}
+    assert matches(doc, query) is expected
+
+
+def test_apply_update():
+    doc = {"_id": 1, "count": 1, "items": ["a"], "drop": True}
+    apply_update(doc, {"$set": {"meta.site": "north"}, "$inc": {"count": 2, "new": 1},
+                       "$unset": {"drop": ""}, "$push": {"items": {"$each": ["b", "c"]}},
+                       "$setOnInsert": {"created": True}})
+    assert doc == {"_id": 1, "count": 3, "new": 1, "items": ["a", "b", "c"], "meta": {"site": "north"}}
+    assert apply_update({}, {"$setOnInsert": {"created": True}}, inserting=True) == {"created": True}
+    assert apply_update(doc, {"only": 1}) == {"_id": 1, "only": 1}
+
+
+def test_keyset_paging_with_pushed_down_ranges(db):
+    async def scenario():
+        messages = db["messages"]
+        await messages.create_indexes([IndexModel([("conversation_id", ASCENDING), ("created_at", ASCENDING)])])
+        await messages.insert_many([
+            {"conversation_id": c, "n": i, "created_at": T0 + timedelta(milliseconds=10 * i)}
+            for i in range(50) for c in ("a", "b")
+        ])
+        pages, after = [], T0 - timedelta(days=1)
+        while True:
+            page = await messages.find({"conversation_id": "a", "created_at": {"$gt": after}}, {"n": 1, "created_at": 1}) \
+                .sort([("created_at", ASCENDING)]).limit(20).to_list(20)
+            if not page:
+                return pages
+            pages.append([doc["n"] for doc in page])
+            after = page[-1]["created_at"]
+
+    assert asyncio.run(scenario()) == [list(range(20)), list(range(20, 40)), list(range(40, 50))]
+
+
+def test_pushdown_covers_or_and_ranges(db):
+    async def scenario():
+        jobs = db["jobs"]
+        await jobs.create_indexes([IndexModel([("status", ASCENDING), ("priority", DESCENDING)])])
+        return jobs._pushdown({"$or": [{"status": "queued", "available_at": {"$lte": T0}},
+                                       {"status": "running"}],
+                               "priority": {"$gte": 1}})
+
+    where, params = asyncio.run(scenario())
+    assert " OR " in where and ">=" in where
+    assert params == ["queued", "running", 1]
+
+
+def test_sub_millisecond_bounds_keep_matches(db):
+    async def scenario():
+        await db["messages"].create_indexes([IndexModel([("created_at", ASCENDING)])])
+        await db["messages"].insert_one({"created_at": T0})
+        return await db["messages"].count_documents({"created_at": {"$lt": T0 + timedelta(microseconds=900)}})
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_unique_index_and_atomic_claims(db):
+    async def scenario():
+        jobs = db["jobs"]
+        await jobs.create_indexes([IndexModel([("key", ASCENDING)], unique=True)])
+        await jobs.insert_many([{"key": str(i), "status": "queued", "priority": i % 3} for i in range(10)])
+        with pytest.raises(DuplicateKeyError):
+            await jobs.insert_one({"key": "0"})
+        claims = await asyncio.gather(*[
+            jobs.find_one_and_update({"status": "queued"}, {"$set": {"status": "running"}},
+                                     sort=[("priority", -1)], return_document=ReturnDocument.AFTER)
+            for _ in range(12)
+        ])
+        return claims
+
+    claims = asyncio.run(scenario())
+    claimed = [c["key"] for c in claims if c]
+    assert len(claimed) == len(set(claimed)) == 10
+    assert [c["priority"] for c in claims[:3]] == [2, 2, 2]
+
+
+def test_update_onto_a_unique_value_raises(db):
+    async def scenario():
+        patients = db["patients"]
+        await patients.create_indexes([IndexModel([("patient_id", ASCENDING)], unique=True)])
+        await patients.insert_many([{"patient_id": "a", "name": "A"}, {"patient_id": "b", "name": "B"}])
+        with pytest.raises(DuplicateKeyError):
+            await patients.update_one({"patient_id": "b"}, {"$set": {"patient_id": "a"}})
+        return sorted([(d["patient_id"], d["name"]) async for d in patients.find({})])
+
+    assert asyncio.run(scenario()) == [("a", "A"), ("b", "B")]
+
+
+def test_command_ping_and_unsupported_commands(db):
+    assert asyncio.run(db.command("ping")) == {"ok": 1.0}
+    with pytest.raises(OperationFailure) as excinfo:
+        asyncio.run(db.command("serverStatus"))
+    assert excinfo.value.code == 59
+
+
+def test_ttl_purge(db):
+    async def scenario():
+        cache = db["symptom_cache"]
+        await cache.create_indexes([IndexModel([("created_at", ASCENDING)], expireAfterSeconds=3600)])
+        now = datetime.utcnow()
+        await cache.insert_many([{"k": "old", "created_at": now - timedelta(hours=2)},
+                                 {"k": "new", "created_at": now},
+                                 {"k": "undated"}])
+        return await db.purge_expired(), sorted([d["k"] async for d in cache.find({})])
+
+    assert asyncio.run(scenario()) == (1, ["new", "undated"])
+
+
+def test_outbox_merges_counters(db, tmp_path):
+    async def scenario():
+        # Another local store stands in for the central MongoDB
+        central = LocalDatabase(str(tmp_path / "central.sqlite3"))
+        await central["chats"].create_indexes([IndexModel([("conversation_id", ASCENDING)], unique=True)])
+        await central["chats"].insert_one({"conversation_id": "c1", "message_count": 10,
+                                           "summary": "central", "summary_cursor": "1735689600000_b"})
+        await db["chats"].update_one({"conversation_id": "c1"},
+                                     {"$inc": {"message_count": 2}}, upsert=True)
+        await db["chats"].update_one({"conversation_id": "c1"}, {"$inc": {"message_count": 1}})
+        args = (db, central, 100, {"chats": "conversation_id"},
+                {"chats": ("message_count",)}, {"chats": ("summary_cursor", ("summary", "summary_cursor"))})
+        synced = await sync_outbox(*args)
+        await db["chats"].update_one({"conversation_id": "c1"}, {"$inc": {"message_count": 4}})
+        await sync_outbox(*args)
+        # A batch resent after a crash before the local bookkeeping is not counted twice
+        await db["chats"].update_one({"conversation_id": "c1"}, {"$inc": {"message_count": 5}})
+        outbox = db.conn.execute("SELECT * FROM outbox").fetchall()
+        counters = db.conn.execute("SELECT * FROM synced_counters").fetchall()
+        await sync_outbox(*args)
+        with db.conn:
+            db.conn.executemany("INSERT INTO outbox VALUES (?, ?, ?, ?, ?)", outbox)
+            db.conn.executemany("INSERT OR REPLACE INTO synced_counters VALUES (?, ?, ?)", counters)
+        await sync_outbox(*args)
+        assert db.pending_outbox() == 0
+        return synced, await central["chats"].find_one({"conversation_id": "c1"})
+
+    synced, chat = asyncio.run(scenario())
+    assert synced == 2
+    assert chat["message_count"] == 22
+    assert chat["summary"] == "central"
+
+
+@pytest.mark.parametrize("edge_cursor, expected", [
+    (None, "central"),
+    ("1735689600000_a", "central"),
+    ("1735689600001_a", "edge"),
+])
+def test_outbox_keeps_the_summary_that_reaches_furthest(db, tmp_path, edge_cursor, expected):
+    async def scenario():
+        central = LocalDatabase(str(tmp_path / "central.sqlite3"))
+        await central["chats"].create_indexes([IndexModel([("conversation_id", ASCENDING)], unique=True)])
+        await central["chats"].insert_one({"conversation_id": "c1", "summary": "central",
+                                           "summary_cursor": "1735689600000_b"})
+        edge = {"summary": "edge", "summary_cursor": edge_cursor} if edge_cursor else {"title": "t"}
+        await db["chats"].update_one({"conversation_id": "c1"}, {"$set": edge}, upsert=True)
+        await sync_outbox(db, central, 100, {"chats": "conversation_id"}, None,
+                          {"chats": ("summary_cursor", ("summary", "summary_cursor"))})
+        return await central["chats"].find_one({"conversation_id": "c1"})
+
+    chat = asyncio.run(scenario())
+    assert chat["summary"] == expected
+    assert chat["summary_cursor"] == (edge_cursor if expected == "edge" else "1735689600000_b")
+
+
+def test_rejected_outbox_entries_are_dead_lettered(tmp_path):
+    async def scenario():
+        central = LocalDatabase(str(tmp_path / "central.sqlite3"))
+        await central["transcripts"].create_indexes([IndexModel([("audio_sha256", ASCENDING)], unique=True)])
+        edges = [LocalDatabase(str(tmp_path / f"edge{i}.sqlite3"), outbox_collections=["transcripts"])
+                 for i in range(2)]
+        for i, edge in enumerate(edges):
+            await edge["transcripts"].insert_one({"audio_sha256": "same", "text": f"edge {i}"})
+            await edge["transcripts"].insert_one({"audio_sha256": f"own {i}"})
+            await sync_outbox(edge, central, 100, {})
+        return edges[1], sorted([d["audio_sha256"] async for d in central["transcripts"].find({})])
+
+    edge, synced = asyncio.run(scenario())
+    assert synced == ["own 0", "own 1", "same"]
+    assert edge.pending_outbox() == 0
+    assert [(collection, "E11000" in error) for _, collection, _, error in edge.dead_letters()] == [("transcripts", True)]
+    assert edge.requeue_dead_letters() == 1
+    assert (edge.pending_outbox(), edge.dead_letters()) == (1, [])
@@ -0,0 +1,46 @@
+import asyncio
+from local_store import LocalDatabase
+from services import patient_profiles
+from services.patient_profiles import bulk_import_patients
+
+
+async def _stream(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def _import(tmp_path, body: bytes, fmt: str, chunk_size: int = 7):
+    async def scenario():
+        db = LocalDatabase(str(tmp_path / "import.sqlite3"))
+        report = await bulk_import_patients(_stream(body, chunk_size), fmt, db)
+        names = {p["patient_id"]: p["name"] async for p in db["patients"].find({})}
+        return report, names
+    return asyncio.run(scenario())
+
+
+def test_quoted_csv_fields_may_span_lines(tmp_path):
+    body = (b"patient_id,name,age,sex,allergies\n"
+            b'p1,"Doe,\nJane",30,female,penicillin;latex\r\n'
+            b"p2,Ann,41,female,\n")
+    report, names = _import(tmp_path, body, "csv")
+    assert report == {"inserted": 2, "failed": 0, "errors": []}
+    assert names == {"p1": "Doe,\nJane", "p2": "Ann"}
+
+
+def test_invalid_utf8_is_a_row_error(tmp_path):
+    body = b'{"patient_id": "p1", "name": "A", "age": 3, "sex": "male"}\n{"name": "\xff"}\n'
+    report, names = _import(tmp_path, body, "ndjson")
+    assert report["inserted"] == 1
+    assert [e["row"] for e in report["errors"]] == [2]
+    assert set(names) == {"p1"}
+
+
+def test_oversized_rows_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(patient_profiles, "MAX_RECORD_BYTES", 100)
+    body = (b'{"patient_id": "p1", "name": "' + b"x" * 500 + b'", "age": 3, "sex": "male"}\n'
+            b'{"patient_id": "p2", "name": "B", "age": 4, "sex": "male"}\n'
+            + b"y" * 500)
+    report, names = _import(tmp_path, body, "ndjson")
+    assert report["inserted"] == 1
+    assert [e["row"] for e in report["errors"]] == [1, 3]
+    assert set(names) == {"p2"}
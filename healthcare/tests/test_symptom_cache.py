@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from local_store import LocalDatabase
+from services import symptom_cache
+from services.symptom_cache import normalize_symptoms, similarity_guard, profile_segment, embed
+
+RESPONSE = {"summary": "s", "probable_conditions": ["flu"], "recommendations": ["rest"],
+            "recommended_tests": [], "recommended_medicines": ["paracetamol"]}
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Fever and headache, since 2 days", "headache and fever. Since 2 days"),
+    ("FEVER, dry cough!", "dry cough and fever"),
+    ("I have had a fever", "fever"),
+])
+def test_equivalent_presentations_share_a_key(a, b):
+    assert normalize_symptoms(a) == normalize_symptoms(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("fever, no cough", "cough, no fever"),
+    ("chest pain, no breathlessness", "breathlessness, no chest pain"),
+    ("left arm pain, chest tightness", "chest pain, left arm tightness"),
+    ("fever and headache for 2 days", "fever and headache for 9 days"),
+    ("temperature 38.5", "temperature 38.9"),
+    ("I don't have fever", "fever"),
+])
+def test_different_presentations_do_not_share_a_key(a, b):
+    assert normalize_symptoms(a) != normalize_symptoms(b)
+
+
+def test_numbers_and_negations_guard_the_similarity_pass():
+    two, nine = normalize_symptoms("fever and headache for 2 days"), normalize_symptoms("fever and headache for 9 days")
+    assert similarity_guard(two) != similarity_guard(nine)
+    assert similarity_guard(normalize_symptoms("fever, no cough")) != similarity_guard(normalize_symptoms("cough, no fever"))
+    assert similarity_guard(two) == similarity_guard(normalize_symptoms("headache, fever for 2days"))
+
+
+def test_negation_changes_the_embedding():
+    assert embed(normalize_symptoms("fever, no cough")) @ embed(normalize_symptoms("cough, no fever")) < 0.9
+
+
+def test_segment_covers_conditions_and_medications():
+    base = profile_segment(30, "male", ["penicillin"], ["diabetes"], ["metformin"])
+    assert base == profile_segment(31, "Male", ["Penicillin "], ["diabetes"], ["metformin"])
+    assert base != profile_segment(30, "male", ["penicillin"], [], ["metformin"])
+    assert base != profile_segment(30, "male", ["penicillin"], ["diabetes"], ["warfarin"])
+
+
+def test_lookup_round_trip(tmp_path):
+    async def scenario():
+        db = LocalDatabase(str(tmp_path / "cache.sqlite3"))
+        profile = (30, "female", [], ["asthma"], ["salbutamol"])
+        await symptom_cache.store(db, "fever and headache for 2 days", *profile, RESPONSE)
+        return (
+            await symptom_cache.lookup(db, "Headache and fever for 2 days.", *profile),
+            await symptom_cache.lookup(db, "fever and headache for 9 days", *profile),
+            await symptom_cache.lookup(db, "fever and headache for 2 days", 30, "female", [], ["asthma"], []),
+        )
+
+    same, other_duration, other_medications = asyncio.run(scenario())
+    assert same == RESPONSE
+    assert other_duration is None
+    assert other_medications is None
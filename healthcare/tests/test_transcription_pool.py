@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from services import whisper_worker
+from services.stt_translate import TranscriptionPool, TranscriptionQueueFull
+
+SHORT = np.zeros(16000, dtype=np.float32)
+LONG = np.zeros(16000 * 60, dtype=np.float32)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    # Stand-ins for the worker functions, run on threads instead of processes
+    calls = []
+
+    def transcribe_clip(audio, model=None):
+        calls.append(1)
+        return {"text": f"{len(audio)}", "whisper": {"model": model}}
+
+    def transcribe_batch(clips):
+        calls.append(len(clips))
+        return [{"text": f"{len(audio)}", "whisper": {"model": model}} for audio, model in clips]
+
+    monkeypatch.setattr(whisper_worker, "transcribe_clip", transcribe_clip)
+    monkeypatch.setattr(whisper_worker, "transcribe_batch", transcribe_batch)
+    return calls
+
+
+def _pool(workers: int, queue_size: int = 16) -> TranscriptionPool:
+    pool = TranscriptionPool(models=["tiny"], workers=workers, queue_size=queue_size,
+                             batch_size=4, batch_window_ms=50)
+    pool._executor = ThreadPoolExecutor(workers)
+    pool._dispatcher = asyncio.create_task(pool._dispatch())
+    return pool
+
+
+def test_short_clips_arriving_together_are_batched(calls):
+    async def scenario():
+        pool = _pool(workers=1)
+        results = await asyncio.gather(*[pool.transcribe(SHORT) for _ in range(5)], pool.transcribe(LONG))
+        await pool.shutdown()
+        return results
+
+    results = asyncio.run(scenario())
+    assert [r["text"] for r in results] == ["16000"] * 5 + [str(len(LONG))]
+    assert sorted(calls) == [1, 1, 4]
+
+
+def test_batches_are_shared_between_free_workers(calls):
+    async def scenario():
+        pool = _pool(workers=2)
+        await asyncio.gather(*[pool.transcribe(SHORT) for _ in range(4)])
+        await pool.shutdown()
+
+    asyncio.run(scenario())
+    assert sum(calls) == 4 and max(calls) <= 3
+
+
+def test_clips_collected_for_a_batch_still_fill_the_queue(calls):
+    async def scenario():
+        pool = _pool(workers=1, queue_size=3)
+        tasks = [asyncio.create_task(pool.transcribe(SHORT)) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(TranscriptionQueueFull):
+            await pool.transcribe(SHORT)
+        await asyncio.gather(*tasks)
+        await pool.shutdown()
+
+    asyncio.run(scenario())
+    assert calls == [3]